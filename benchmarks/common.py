@@ -0,0 +1,168 @@
+"""
+Shared helpers for the benchmark scripts: seed a database, boot the app under
+gunicorn and drive it with a pool of concurrent HTTP clients.
+"""
+import os
+import sys
+import time
+import socket
+import subprocess
+import http.client
+import threading
+from contextlib import contextmanager
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+BENCH_SECRET = "benchmark-secret-key-benchmark-secret"
+BENCH_PASSWORD = "secret"
+
+def seed_database(database_url, characters=1000, planets=1000, users=10, favorites=10000, batch=5000):
+    # runs in a child process so this one does not import the app with the wrong env
+    script = """
+import os, sys
+sys.path.insert(0, %r)
+from sqlalchemy import insert
+from app import app
+from models import db, User, Character, Planet, Favorite
+from passwords import make_hash
+characters, planets, users, favorites, batch = %d, %d, %d, %d, %d
+users = max(users, -(-favorites // max(characters + planets, 1)))
+def chunked(rows):
+    for start in range(0, len(rows), batch):
+        yield rows[start:start + batch]
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+    password = make_hash(%r)
+    for model, rows in (
+        (User, [{"email": "user%%d@example.com" %% i, "password": password, "is_active": True} for i in range(users)]),
+        (Character, [{"name": "Character %%d" %% i, "height": 100 + i %% 120, "mass": 40 + i %% 90,
+                      "hair_color": "brown", "skin_color": "fair", "eye_color": ("blue", "brown", "red")[i %% 3],
+                      "birth_year": "%%dBBY" %% (i %% 900), "gender": ("male", "female", "n/a")[i %% 3]} for i in range(characters)]),
+        (Planet, [{"name": "Planet %%d" %% i, "rotation_period": 24, "orbital_period": 300 + i %% 200, "diameter": 5000 + i,
+                   "climate": ("arid", "temperate", "frozen")[i %% 3], "gravity": "1 standard",
+                   "terrain": ("desert", "forest", "tundra")[i %% 3], "surface_water": "1", "population": i * 1000} for i in range(planets)]),
+    ):
+        for rows_batch in chunked(rows):
+            db.session.execute(insert(model), rows_batch)
+    items = characters + planets
+    for start in range(0, favorites, batch):
+        rows = []
+        for i in range(start, min(start + batch, favorites)):
+            item = i %% items
+            row = {"user_id": i // items + 1, "character_id": None, "planet_id": None}
+            if item < characters:
+                row["character_id"] = item + 1
+            else:
+                row["planet_id"] = item - characters + 1
+            rows.append(row)
+        db.session.execute(insert(Favorite), rows)
+    db.session.commit()
+""" % (SRC, characters, planets, users, favorites, batch, BENCH_PASSWORD)
+    env = dict(os.environ, DATABASE_URL=database_url, PASSWORD_KEY=BENCH_SECRET)
+    subprocess.run([sys.executable, "-c", script], env=env, check=True, cwd=SRC)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def gunicorn(database_url, extra_env=None):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, PASSWORD_KEY=BENCH_SECRET,
+               GUNICORN_BIND="127.0.0.1:%d" % port)
+    # the benchmarks hammer /login and /signup from one IP, the rate limiter would answer 429
+    env.setdefault("RATE_LIMIT_BACKEND", "none")
+    env.pop("PORT", None)
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "wsgi", "--chdir", SRC],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                request("127.0.0.1", port, "GET", "/stats/pool")
+                break
+            except OSError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+        yield "127.0.0.1", port
+    finally:
+        process.terminate()
+        process.wait()
+
+def request(host, port, method, path, body=None, headers=None, connection=None):
+    own = connection is None
+    connection = connection or http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, data
+    finally:
+        if own:
+            connection.close()
+
+def run_load(host, port, make_request, concurrency=8, duration=10.0):
+    # make_request(worker_index, iteration) -> (method, path, body, headers)
+    # returns a list of (latency seconds, status)
+    results = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(index):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        local = []
+        iteration = 0
+        while time.perf_counter() < stop_at:
+            method, path, body, headers = make_request(index, iteration)
+            iteration += 1
+            start = time.perf_counter()
+            try:
+                status, data = request(host, port, method, path, body, headers, connection)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                status = 0
+            local.append((time.perf_counter() - start, status))
+        connection.close()
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+# a route with more non 2xx/3xx responses than this is reported as failed
+MAX_FAILED_FRACTION = 0.05
+
+def summarize(results, duration):
+    # throughput and latency only count successful responses, fast 429/503
+    # rejections would otherwise read as a faster route
+    latencies = sorted(latency for latency, status in results if 0 < status < 400)
+    errors = len([status for latency, status in results if status == 0 or status >= 500])
+    rejected = len([status for latency, status in results if status in (429, 503)])
+    failed_fraction = (len(results) - len(latencies)) / len(results) if results else 1.0
+    return {
+        "requests": len(results),
+        "ok": len(latencies),
+        "errors": errors,
+        "rejected": rejected,
+        "failed": failed_fraction > MAX_FAILED_FRACTION,
+        "requests_per_second": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
@@ -0,0 +1,80 @@
+"""
+Compare the old and new JSON paths of the list endpoints, in bytes/second.
+
+    python benchmarks/json_encoding.py --rows 10000
+
+old:      ORM objects -> serialize() -> stdlib provider (Flask default)
+fast:     ORM objects -> serialize() -> FastJSONProvider (orjson/msgspec)
+columns:  plain rows of Model.serialize_columns() -> serialize_rows() -> FastJSONProvider
+
+"encode" times only the JSON step, "load+encode" includes the SELECT and the
+objects/dicts built from it.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "json_bench.db")
+os.environ.setdefault("PASSWORD_KEY", "benchmark-secret-key-benchmark-secret")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character, serialize_rows  # noqa: E402
+from json_provider import FastJSONProvider  # noqa: E402
+
+def measure(function, repeat):
+    best = None
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(function())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return size, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Character), [
+            {"name": "Character %d" % i, "height": 100 + i % 100, "mass": 80, "hair_color": "brown",
+             "skin_color": "fair", "eye_color": "blue", "birth_year": "19BBY", "gender": "male"}
+            for i in range(args.rows)])
+        db.session.commit()
+
+        def load_objects():
+            db.session.expunge_all()
+            return [character.serialize() for character in Character.query.order_by(Character.id).all()]
+
+        def load_rows():
+            query = Character.query.with_entities(*Character.serialize_columns()).order_by(Character.id)
+            return serialize_rows(query.all())
+
+        objects = load_objects()
+        rows = load_rows()
+        cases = [
+            ("old", "encode", lambda: stdlib.dumps({"results": objects}).encode()),
+            ("fast", "encode", lambda: fast.dump_bytes({"results": objects})),
+            ("columns", "encode", lambda: fast.dump_bytes({"results": rows})),
+            ("old", "load+encode", lambda: stdlib.dumps({"results": load_objects()}).encode()),
+            ("fast", "load+encode", lambda: fast.dump_bytes({"results": load_objects()})),
+            ("columns", "load+encode", lambda: fast.dump_bytes({"results": load_rows()})),
+        ]
+        print("json backend: %s, rows: %d" % (fast.backend, args.rows))
+        print("%-8s %-12s %10s %10s %12s" % ("path", "step", "bytes", "ms", "MB/s"))
+        for name, step, function in cases:
+            size, elapsed = measure(function, args.repeat)
+            print("%-8s %-12s %10d %10.2f %12.1f" % (name, step, size, elapsed * 1000, size / elapsed / 1e6))
+
+if __name__ == "__main__":
+    main()
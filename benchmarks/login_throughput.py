@@ -0,0 +1,70 @@
+"""
+Micro-benchmark of POST /login throughput for different password work factors.
+
+    python benchmarks/login_throughput.py
+    python benchmarks/login_throughput.py --methods scrypt:16384:8:1 pbkdf2:sha256:600000 --clients 8
+
+Runs the real login view through the Flask test client against a throwaway
+SQLite database, so the numbers include the hash slots in passwords.py. The
+login rate limit is off (RATE_LIMIT_BACKEND=none) unless set in the environment.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "login_bench.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_FILE
+os.environ.setdefault("PASSWORD_KEY", "benchmark-secret-key-benchmark-secret")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app import app  # noqa: E402
+from models import db, User  # noqa: E402
+import passwords  # noqa: E402
+
+DEFAULT_METHODS = ["pbkdf2:sha256:100000", "pbkdf2:sha256:600000", "scrypt:16384:8:1", "scrypt:32768:8:1"]
+
+def run(method, clients, requests):
+    passwords.HASH_METHOD = method
+    with app.app_context():
+        User.query.delete()
+        db.session.add(User(email="bench@example.com", password=passwords.make_hash("secret", method), is_active=True))
+        db.session.commit()
+
+    def login(_):
+        client = app.test_client()
+        response = client.post("/login", json={"email": "bench@example.com", "password": "secret"})
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        statuses = list(pool.map(login, range(requests)))
+    elapsed = time.perf_counter() - start
+    counts = Counter(statuses)
+    ok = counts.pop(200, 0)
+    return {"method": method, "ok": ok, "rejected": counts.pop(503, 0), "other": dict(counts),
+            "seconds": elapsed, "logins_per_second": ok / elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+    print("hash workers: %d, wait: %.1fs, clients: %d" % (passwords.HASH_SLOTS, passwords.HASH_WAIT, args.clients))
+    print("%-24s %8s %8s %10s  %s" % ("method", "ok", "503", "logins/s", "other statuses"))
+    for method in args.methods:
+        result = run(method, args.clients, args.requests)
+        other = ", ".join("%d x%d" % (status, count) for status, count in sorted(result["other"].items()))
+        print("%-24s %8d %8d %10.1f  %s" % (result["method"], result["ok"], result["rejected"],
+                                            result["logins_per_second"], other or "-"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Check the read replica routing with two local SQLite files standing in for
+the primary and the replica (no replication between them, we copy by hand).
+
+    python benchmarks/replica_harness.py
+
+Exits 1 if any check fails.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+WORKDIR = tempfile.mkdtemp()
+PRIMARY = os.path.join(WORKDIR, "primary.db")
+REPLICA = os.path.join(WORKDIR, "replica.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + PRIMARY
+os.environ["DATABASE_REPLICA_URL"] = "sqlite:///" + REPLICA
+os.environ["REPLICA_STICKY_SECONDS"] = "2"
+os.environ.setdefault("PASSWORD_KEY", "benchmark-secret-key-benchmark-secret")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+
+failures = []
+
+def check(name, condition):
+    print("%s  %s" % ("PASS" if condition else "FAIL", name))
+    if not condition:
+        failures.append(name)
+
+def names(response):
+    return [character["name"] for character in response.get_json()["results"]]
+
+def replicate():
+    # what streaming replication would eventually do
+    with app.app_context():
+        db.engines["replica"].dispose()
+    shutil.copyfile(PRIMARY, REPLICA)
+
+def main():
+    with app.app_context():
+        db.create_all()
+    replicate()
+
+    writer = app.test_client()
+    reader = app.test_client()
+    reader.environ_base["REMOTE_ADDR"] = "10.0.0.2"
+    reader_without_cookie = app.test_client(use_cookies=False)
+    reader_without_cookie.environ_base["REMOTE_ADDR"] = "10.0.0.3"
+
+    response = writer.post("/characters/bulk", json=[{"name": "Luke Skywalker"}])
+    check("write goes to the primary", response.status_code == 200)
+    check("writer reads its own write right after (primary)", names(writer.get("/characters")) == ["Luke Skywalker"])
+    check("other callers read from the replica (not replicated yet)", names(reader.get("/characters")) == [])
+    check("the writer is not served the other caller's replica read from the cache",
+          names(writer.get("/characters")) == ["Luke Skywalker"])
+
+    writer_elsewhere = app.test_client()
+    writer_elsewhere.environ_base["REMOTE_ADDR"] = "10.0.0.4"
+    writer_elsewhere.set_cookie(**{"key": "db_primary_until", "value": "9999999999"})
+    check("the sticky cookie alone keeps a caller on the primary",
+          names(writer_elsewhere.get("/characters")) == ["Luke Skywalker"])
+
+    replicate()
+    check("replica serves the row once replicated", names(reader_without_cookie.get("/characters")) == ["Luke Skywalker"])
+
+    with open(REPLICA, "r+b") as replica_file:
+        replica_file.truncate(0)
+    with app.app_context():
+        db.engines["replica"].dispose()
+    check("POST still works with a broken replica", writer.post("/characters/bulk", json=[{"name": "Leia"}]).status_code == 200)
+
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Typeahead latency of /search on the SQLite fallback (in-process name index).
+
+    python benchmarks/search_latency.py --names 100000
+
+Seeds characters and planets, then times GET /search?q=<2-4 letter prefix>
+through the Flask test client. The first request builds the index and is
+reported on its own. Target: p95 under 10ms.
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "search_bench.db")
+os.environ.setdefault("PASSWORD_KEY", "benchmark-secret-key-benchmark-secret")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character, Planet  # noqa: E402
+from common import percentile  # noqa: E402
+
+def random_name(rng):
+    words = rng.randint(1, 3)
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).title()
+                    for _ in range(words))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with app.app_context():
+        db.create_all()
+        half = args.names // 2
+        for model, count in ((Character, half), (Planet, args.names - half)):
+            names = set()
+            while len(names) < count:
+                names.add(random_name(rng))
+            db.session.execute(insert(model), [{"name": name} for name in names])
+        db.session.commit()
+
+    client = app.test_client()
+    start = time.perf_counter()
+    client.get("/search?q=a")
+    print("index build (first request): %.1fms" % ((time.perf_counter() - start) * 1000))
+
+    latencies = []
+    for _ in range(args.queries):
+        prefix = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 4)))
+        start = time.perf_counter()
+        response = client.get("/search?q=" + prefix)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    latencies.sort()
+    print("%d names, %d queries: p50 %.2fms  p95 %.2fms  p99 %.2fms" % (
+        args.names, args.queries, percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.95) * 1000, percentile(latencies, 0.99) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Load test of the list endpoints under each gunicorn worker class.
+
+    python benchmarks/serving_modes.py
+    DATABASE_URL=postgresql://... python benchmarks/serving_modes.py --modes sync gthread gevent
+
+With the default throwaway SQLite file there is almost no I/O wait, run it
+against Postgres to see what the threaded/green workers buy while a request
+waits on the database.
+"""
+import os
+import argparse
+import tempfile
+from common import seed_database, gunicorn, run_load, summarize
+
+PATHS = ["/characters", "/planets", "/favorites", "/users"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "serving.db")
+    seed_database(database_url, characters=args.rows, planets=args.rows, favorites=args.rows * 5)
+
+    def make_request(index, iteration):
+        # the catalog cache is disabled below, every request reaches the database
+        return "GET", PATHS[(index + iteration) % len(PATHS)], None, {}
+
+    print("%-10s %10s %10s %10s %10s" % ("mode", "req/s", "p50 ms", "p95 ms", "errors"))
+    for mode in args.modes:
+        env = {"GUNICORN_WORKER_CLASS": mode, "WEB_CONCURRENCY": str(args.workers), "CACHE_BACKEND": "none"}
+        with gunicorn(database_url, env) as (host, port):
+            summary = summarize(run_load(host, port, make_request, args.concurrency, args.duration), args.duration)
+        print("%-10s %10.1f %10.1f %10.1f %10d" % (mode, summary["requests_per_second"], summary["p50_ms"],
+                                                   summary["p95_ms"], summary["errors"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Cold start benchmark: how long `import app` and a gunicorn worker boot take.
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --runs 10 --top 15
+    python benchmarks/startup_time.py --output after.json --baseline before.json --threshold 0.15
+
+For each configuration (defaults, ENABLE_ADMIN=0, ENABLE_MIGRATIONS=1) it
+reports:
+  - the `python -X importtime -c "import app"` total and the slowest modules
+    imported directly by app.py
+  - the median wall time of a fresh interpreter importing app
+  - the median time from starting gunicorn (one worker) to the first 200 on /healthz
+No database is needed, /healthz does not touch it. With --baseline, configurations
+whose import or boot time grew more than the threshold make the exit code 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from common import ROOT, SRC, BENCH_SECRET, free_port, request
+from suite import git_revision
+
+CONFIGURATIONS = {
+    "default": {},
+    "no admin": {"ENABLE_ADMIN": "0"},
+    "migrations": {"ENABLE_MIGRATIONS": "1"},
+}
+
+def app_env(database_url, extra_env):
+    env = dict(os.environ, DATABASE_URL=database_url, PASSWORD_KEY=BENCH_SECRET)
+    for name in ("PORT", "FLASK_RUN_FROM_CLI", "ENABLE_ADMIN", "ENABLE_MIGRATIONS"):
+        env.pop(name, None)
+    env.update(extra_env)
+    return env
+
+def import_times(env):
+    # -X importtime lines: "import time: self [us] | cumulative | <indent>package"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            env=env, cwd=SRC, capture_output=True, text=True, check=True)
+    total = None
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == "app":
+            total = int(cumulative_us) / 1000
+        elif depth == 1:
+            modules.append((name.strip(), int(cumulative_us) / 1000))
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return total, modules
+
+def import_wall_time(env, runs):
+    times = []
+    for run in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import app"], env=env, cwd=SRC, check=True)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+def worker_boot_time(env, runs):
+    times = []
+    for run in range(runs):
+        port = free_port()
+        boot_env = dict(env, GUNICORN_BIND="127.0.0.1:%d" % port, WEB_CONCURRENCY="1")
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "wsgi", "--chdir", SRC],
+            env=boot_env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    status, body = request("127.0.0.1", port, "GET", "/healthz")
+                    if status == 200:
+                        break
+                except OSError:
+                    pass
+                if process.poll() is not None or time.perf_counter() - started > 30:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.005)
+            times.append(time.perf_counter() - started)
+        finally:
+            process.terminate()
+            process.wait()
+    return statistics.median(times) * 1000
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results["configurations"].items():
+        previous = baseline.get("configurations", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("import_ms", "boot_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append("%s %s %.0fms -> %.0fms" % (name, metric, previous[metric], current[metric]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="runs per wall time measurement")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports to show")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results", "startup.json"))
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "startup.db")
+    results = {"revision": git_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args),
+               "configurations": {}}
+    for name, extra_env in CONFIGURATIONS.items():
+        env = app_env(database_url, extra_env)
+        total, modules = import_times(env)
+        summary = {
+            "importtime_ms": total,
+            "import_ms": import_wall_time(env, args.runs),
+            "boot_ms": worker_boot_time(env, args.runs),
+            "slowest_imports": dict(modules[:args.top]),
+        }
+        results["configurations"][name] = summary
+        print("%-12s importtime %7.1fms   python -c 'import app' %7.1fms   gunicorn boot %7.1fms" % (
+            name, total, summary["import_ms"], summary["boot_ms"]))
+        for module, cumulative in modules[:args.top]:
+            print("    %-28s %7.1fms" % (module, cumulative))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print("results written to " + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("REGRESSIONS above %d%%:" % (args.threshold * 100))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("no regressions above %d%%" % (args.threshold * 100))
+
+if __name__ == "__main__":
+    main()
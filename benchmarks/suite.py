@@ -0,0 +1,133 @@
+"""
+Latency/throughput benchmark of every endpoint in app.py.
+
+    python benchmarks/suite.py                                   # small SQLite dataset
+    python benchmarks/suite.py --characters 10000 --planets 10000 --favorites 1000000
+    python benchmarks/suite.py --output after.json --baseline before.json --threshold 0.15
+
+Seeds a throwaway SQLite file (or DATABASE_URL, which gets wiped), boots the
+app under gunicorn.conf.py and hits each route with concurrent keep-alive
+clients. Results (p50/p95/p99 ms, req/s) go to a JSON file that can be diffed
+between commits. Only successful responses count towards them, a route with
+more than 5% other responses (429/503 rejections, errors) is marked FAILED.
+With --baseline, failed routes and routes whose p95 or throughput got worse
+than the threshold are listed and the exit code is 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from common import seed_database, gunicorn, request, run_load, summarize, BENCH_PASSWORD
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def routes(token, refresh_token, counts):
+    auth = {"Authorization": "Bearer " + token}
+    refresh = {"Authorization": "Bearer " + refresh_token}
+    login_body = json.dumps({"email": "user0@example.com", "password": BENCH_PASSWORD})
+
+    def item(collection, total):
+        return lambda index, iteration: ("GET", "/%s/%d" % (collection, (index * 7919 + iteration) % total + 1), None, {})
+
+    def signup(index, iteration):
+        body = json.dumps({"email": "bench-%d-%d-%d@example.com" % (os.getpid(), index, iteration), "password": "pw"})
+        return "POST", "/signup", body, JSON_HEADERS
+
+    return {
+        "GET /": lambda index, iteration: ("GET", "/", None, {}),
+        "POST /login": lambda index, iteration: ("POST", "/login", login_body, JSON_HEADERS),
+        "POST /refresh": lambda index, iteration: ("POST", "/refresh", None, refresh),
+        "GET /profile": lambda index, iteration: ("GET", "/profile", None, auth),
+        "GET /me/favorites": lambda index, iteration: ("GET", "/me/favorites", None, auth),
+        "POST /signup": signup,
+        "GET /users": lambda index, iteration: ("GET", "/users", None, {}),
+        "GET /users/<id>": item("users", counts["users"]),
+        "GET /characters": lambda index, iteration: ("GET", "/characters", None, {}),
+        "GET /characters/<id>": item("characters", counts["characters"]),
+        "GET /planets": lambda index, iteration: ("GET", "/planets", None, {}),
+        "GET /planets/<id>": item("planets", counts["planets"]),
+        "GET /favorites": lambda index, iteration: ("GET", "/favorites", None, {}),
+        "GET /favorites/<id>": item("favorites", counts["favorites"]),
+    }
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(name)
+        if current.get("failed"):
+            regressions.append("%s failed, %d of %d requests not successful" % (
+                name, current["requests"] - current["ok"], current["requests"]))
+            continue
+        if previous is None or previous.get("failed"):
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append("%s p95 %.1fms -> %.1fms" % (name, previous["p95_ms"], current["p95_ms"]))
+        if previous["requests_per_second"] and current["requests_per_second"] < previous["requests_per_second"] * (1 - threshold):
+            regressions.append("%s req/s %.1f -> %.1f" % (name, previous["requests_per_second"], current["requests_per_second"]))
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--favorites", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per route")
+    parser.add_argument("--routes", nargs="*", help="only run routes containing one of these strings")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results", "latest.json"))
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "suite.db")
+    started = time.time()
+    seed_database(database_url, args.characters, args.planets, args.users, args.favorites)
+    print("seeded in %.1fs" % (time.time() - started))
+    # the seeder raises the user count so every favorite is unique
+    counts = {"characters": args.characters, "planets": args.planets, "favorites": args.favorites,
+              "users": max(args.users, -(-args.favorites // max(args.characters + args.planets, 1)))}
+
+    results = {"revision": git_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "routes": {}}
+    with gunicorn(database_url) as (host, port):
+        status, body = request(host, port, "POST", "/login",
+                               json.dumps({"email": "user0@example.com", "password": BENCH_PASSWORD}), JSON_HEADERS)
+        if status != 200:
+            sys.exit("login failed: %d %s" % (status, body[:200]))
+        tokens = json.loads(body)
+        print("%-22s %10s %9s %9s %9s %7s %9s" % ("route", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors", "rejected"))
+        for name, make_request in routes(tokens["access_token"], tokens["refresh_token"], counts).items():
+            if args.routes and not any(part in name for part in args.routes):
+                continue
+            summary = summarize(run_load(host, port, make_request, args.concurrency, args.duration), args.duration)
+            results["routes"][name] = summary
+            print("%-22s %10.1f %9.1f %9.1f %9.1f %7d %9d%s" % (
+                name, summary["requests_per_second"], summary["p50_ms"], summary["p95_ms"], summary["p99_ms"],
+                summary["errors"], summary["rejected"], "  FAILED" if summary["failed"] else ""))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print("results written to " + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("REGRESSIONS above %d%%:" % (args.threshold * 100))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("no regressions above %d%%" % (args.threshold * 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Gunicorn settings, used by the Procfile and render.yml:
+
+    gunicorn -c gunicorn.conf.py wsgi --chdir ./src/
+
+GUNICORN_WORKER_CLASS picks how a worker waits on Postgres:
+    gthread (default)  a few threads per worker, no extra dependencies
+    gevent             greenlets, needs `pipenv install gevent psycogreen`
+    sync               one request per worker (the old behaviour)
+
+Keep threads (or gevent connections doing DB work) per worker in line with
+DB_POOL_SIZE + DB_MAX_OVERFLOW, otherwise requests queue on the pool instead.
+
+WEB_CONCURRENCY defaults to the CPUs this container may use (affinity and the
+cgroup quota, not the host's count): CPUs * 2 + 1 for sync, CPUs + 1 for the
+threaded and gevent workers, at most GUNICORN_MAX_WORKERS. Every worker keeps
+its own pool, so workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) must fit in
+DB_MAX_CONNECTIONS: the default is lowered to fit, an explicit WEB_CONCURRENCY
+that does not fit stops the server from starting.
+"""
+import os
+import math
+
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2 quota, e.g. "50000 100000" for half a CPU or "max 100000"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def connections_per_worker():
+    if os.getenv("DB_POOL_MODE", "queue") == "pgbouncer":
+        return 0
+    return int(os.getenv("DB_POOL_SIZE", 5)) + int(os.getenv("DB_MAX_OVERFLOW", 5))
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 4 if worker_class == "gthread" else 1))
+
+max_connections = int(os.getenv("DB_MAX_CONNECTIONS", 90))
+per_worker = connections_per_worker()
+if "WEB_CONCURRENCY" in os.environ:
+    workers = int(os.environ["WEB_CONCURRENCY"])
+    if per_worker and workers * per_worker > max_connections:
+        raise RuntimeError("WEB_CONCURRENCY=%d workers * %d pooled connections exceeds DB_MAX_CONNECTIONS=%d"
+                           % (workers, per_worker, max_connections))
+else:
+    cpus = available_cpus()
+    workers = cpus * 2 + 1 if worker_class == "sync" else cpus + 1
+    workers = min(workers, int(os.getenv("GUNICORN_MAX_WORKERS", 8)))
+    if per_worker:
+        workers = max(1, min(workers, max_connections // per_worker))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# gunicorn binds to $PORT on its own when it is set (Render does)
+if "PORT" not in os.environ:
+    bind = os.getenv("GUNICORN_BIND", "0.0.0.0:3000")
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # make psycopg2 yield to other greenlets while it waits on Postgres
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,32 @@
+"""widen user.password for salted hashes
+
+Revision ID: 2b7d4e91c0a3
+Revises: fe29ce46a9eb
+Create Date: 2026-10-18 11:02:17.530116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7d4e91c0a3'
+down_revision = 'fe29ce46a9eb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.VARCHAR(length=80),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.VARCHAR(length=80),
+               existing_nullable=False)
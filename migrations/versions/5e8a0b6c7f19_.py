@@ -0,0 +1,34 @@
+"""trigram name indexes for search
+
+Revision ID: 5e8a0b6c7f19
+Revises: 9c31f5a8d2e4
+Create Date: 2026-10-18 14:08:33.271956
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a0b6c7f19'
+down_revision = '9c31f5a8d2e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # only Postgres has pg_trgm, other databases search with the in-process index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_character_name_trgm', 'character', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_planet_name_trgm', 'planet', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_planet_name_trgm', table_name='planet')
+    op.drop_index('ix_character_name_trgm', table_name='character')
@@ -0,0 +1,36 @@
+"""favorite foreign keys ON DELETE CASCADE
+
+Revision ID: 7d2c9e4b1a86
+Revises: 5e8a0b6c7f19
+Create Date: 2026-10-18 16:05:12.417035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2c9e4b1a86'
+down_revision = '5e8a0b6c7f19'
+branch_labels = None
+depends_on = None
+
+REFERENCES = (('user_id', 'user'), ('character_id', 'character'), ('planet_id', 'planet'))
+
+# the original constraints have no name in the model. Postgres named them
+# favorite_<column>_fkey, on SQLite batch mode names the reflected ones with this convention
+naming_convention = {"fk": "favorite_%(column_0_name)s_fkey"}
+
+
+def upgrade():
+    with op.batch_alter_table('favorite', schema=None, naming_convention=naming_convention) as batch_op:
+        for column, table in REFERENCES:
+            batch_op.drop_constraint('favorite_%s_fkey' % column, type_='foreignkey')
+            batch_op.create_foreign_key('favorite_%s_fkey' % column, table, [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('favorite', schema=None, naming_convention=naming_convention) as batch_op:
+        for column, table in REFERENCES:
+            batch_op.drop_constraint('favorite_%s_fkey' % column, type_='foreignkey')
+            batch_op.create_foreign_key('favorite_%s_fkey' % column, table, [column], ['id'])
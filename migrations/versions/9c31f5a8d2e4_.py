@@ -0,0 +1,44 @@
+"""catalog filter and sort indexes
+
+Revision ID: 9c31f5a8d2e4
+Revises: 2b7d4e91c0a3
+Create Date: 2026-10-18 13:26:50.804417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c31f5a8d2e4'
+down_revision = '2b7d4e91c0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index('ix_planet_climate', ['climate'], unique=False)
+        batch_op.create_index('ix_planet_terrain', ['terrain'], unique=False)
+        batch_op.create_index('ix_planet_population_id', ['population', 'id'], unique=False)
+        batch_op.create_index('ix_planet_diameter_id', ['diameter', 'id'], unique=False)
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index('ix_character_gender', ['gender'], unique=False)
+        batch_op.create_index('ix_character_eye_color', ['eye_color'], unique=False)
+        batch_op.create_index('ix_character_height_id', ['height', 'id'], unique=False)
+        batch_op.create_index('ix_character_mass_id', ['mass', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_index('ix_character_mass_id')
+        batch_op.drop_index('ix_character_height_id')
+        batch_op.drop_index('ix_character_eye_color')
+        batch_op.drop_index('ix_character_gender')
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.drop_index('ix_planet_diameter_id')
+        batch_op.drop_index('ix_planet_population_id')
+        batch_op.drop_index('ix_planet_terrain')
+        batch_op.drop_index('ix_planet_climate')
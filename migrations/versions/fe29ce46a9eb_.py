@@ -0,0 +1,45 @@
+"""favorite indexes
+
+Revision ID: fe29ce46a9eb
+Revises: 87f890d92cfa
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fe29ce46a9eb'
+down_revision = '87f890d92cfa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop duplicated favorites so the unique indexes can be built
+    op.execute(
+        "DELETE FROM favorite WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM favorite "
+        "GROUP BY user_id, character_id, planet_id) AS keep)"
+    )
+
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.create_index('ix_favorite_user_id', ['user_id'], unique=False)
+        batch_op.create_index('ix_favorite_character_id', ['character_id'], unique=False)
+        batch_op.create_index('ix_favorite_planet_id', ['planet_id'], unique=False)
+        batch_op.create_index('uq_favorite_user_character', ['user_id', 'character_id'], unique=True,
+                              postgresql_where=sa.text('character_id IS NOT NULL'),
+                              sqlite_where=sa.text('character_id IS NOT NULL'))
+        batch_op.create_index('uq_favorite_user_planet', ['user_id', 'planet_id'], unique=True,
+                              postgresql_where=sa.text('planet_id IS NOT NULL'),
+                              sqlite_where=sa.text('planet_id IS NOT NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.drop_index('uq_favorite_user_planet')
+        batch_op.drop_index('uq_favorite_user_character')
+        batch_op.drop_index('ix_favorite_planet_id')
+        batch_op.drop_index('ix_favorite_character_id')
+        batch_op.drop_index('ix_favorite_user_id')
@@ -2,18 +2,139 @@ import os
 from flask_admin import Admin
 from models import db, User,Character,Planet,Favorite
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import FilterEqual, FilterGreater, FilterSmaller
+from sqlalchemy import func, text
+from sqlalchemy.orm import joinedload, configure_mappers
+
+# list pages count exactly up to this many rows, past it Postgres' estimate (or this cap) is shown
+EXACT_COUNT_LIMIT = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 10000))
+
+def estimated_count(session, table):
+    # planner estimate from the last ANALYZE, -1 (or 0) when the table was never analyzed
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = session.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                               {"table": '"%s"' % table}).scalar()
+    return estimate if estimate and estimate > 0 else None
+
+class LargeTableView(ModelView):
+    """
+    ModelView for tables too big for COUNT(*) and OFFSET paging.
+
+    Counts stop at EXACT_COUNT_LIMIT. Pages in id order are fetched with
+    id > (last id of the previous page) when that page was seen before with
+    the same page size, which is the case when walking through the list with
+    the pager. Other
+    sorts are limited to indexed columns and still use OFFSET.
+    """
+    page_size = 50
+    column_display_pk = True
+    column_default_sort = ("id", False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_ends = {}  # (listing, page) -> last id on that page
+
+    def row_count(self, query, filtered):
+        if not filtered:
+            estimate = estimated_count(self.session, self.model.__tablename__)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        rows = query.with_entities(self.model.id).order_by(None).limit(EXACT_COUNT_LIMIT).subquery()
+        return self.session.query(func.count()).select_from(rows).scalar()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        page_size = page_size or self.page_size
+        joins = {}
+        count_joins = {}
+        query = self.get_query()
+        if self._search_supported and search:
+            query, _, joins, count_joins = self._apply_search(query, None, joins, count_joins, search)
+        if filters and self._filters:
+            query, _, joins, count_joins = self._apply_filters(query, None, joins, count_joins, filters)
+        count = self.row_count(query, filtered=bool(search or filters))
+
+        for relation in self._auto_joins:
+            query = query.options(joinedload(relation))
+
+        # the last id of a page depends on the page size too (?page_size= is honoured),
+        # with it in the key a stored end is valid for any admin user of this worker
+        listing = (sort_column, sort_desc, search, repr(filters), page_size)
+        if sort_column in (None, "id"):
+            descending = bool(sort_desc) and sort_column is not None
+            query = query.order_by(self.model.id.desc() if descending else self.model.id)
+            after = self.page_ends.get((listing, page - 1)) if page else None
+            if after is not None:
+                query = query.filter(self.model.id < after if descending else self.model.id > after).limit(page_size)
+            else:
+                query = self._apply_pagination(query, page, page_size)
+        else:
+            query, joins = self._apply_sorting(query, joins, sort_column, sort_desc)
+            # id breaks ties so OFFSET pages do not overlap
+            query = self._apply_pagination(query.order_by(self.model.id), page, page_size)
+
+        if not execute:
+            return count, query
+        rows = query.all()
+        if rows:
+            if len(self.page_ends) > 10000:
+                self.page_ends.clear()
+            self.page_ends[(listing, page or 0)] = rows[-1].id
+        return count, rows
+
+def catalog_filters(model):
+    # only the indexed columns: equality on filter_fields, ranges on range_fields
+    filters = [FilterEqual(getattr(model, field), field.replace("_", " ").title()) for field in model.filter_fields]
+    for field in model.range_fields:
+        filters.append(FilterGreater(getattr(model, field), field.title()))
+        filters.append(FilterSmaller(getattr(model, field), field.title()))
+    return filters
+
+class UserView(LargeTableView):
+    column_exclude_list = ("password",)
+    column_sortable_list = ("id", "email")
+    column_filters = (FilterEqual(User.email, "Email"),)
+    form_excluded_columns = ("favorites",)
+
+class CharacterView(LargeTableView):
+    # name has a unique index, and a trigram index for the ILIKE search on Postgres
+    column_searchable_list = ("name",)
+    column_sortable_list = ("id",) + Character.sort_fields
+    column_filters = catalog_filters(Character)
+    form_excluded_columns = ("favorite_of",)
+
+class PlanetView(LargeTableView):
+    column_searchable_list = ("name",)
+    column_sortable_list = ("id",) + Planet.sort_fields
+    column_filters = catalog_filters(Planet)
+    form_excluded_columns = ("favorite_of",)
+
+class FavoriteView(LargeTableView):
+    # relations in column_list are joinedloaded, the forms search them instead of listing every row
+    column_list = ("id", "user", "character", "planet")
+    column_sortable_list = ("id",)
+    column_filters = (FilterEqual(Favorite.user_id, "User id"), FilterEqual(Favorite.character_id, "Character id"),
+                      FilterEqual(Favorite.planet_id, "Planet id"))
+    form_ajax_refs = {
+        "user": {"fields": ("email",), "page_size": 10},
+        "character": {"fields": ("name",), "page_size": 10},
+        "planet": {"fields": ("name",), "page_size": 10},
+    }
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
+    # the Favorite.user/character/planet backrefs only exist once the mappers are configured
+    configure_mappers()
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Favorite, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(CharacterView(Character, db.session))
+    admin.add_view(PlanetView(Planet, db.session))
+    admin.add_view(FavoriteView(Favorite, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(LargeTableView(YourModelName, db.session))
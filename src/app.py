@@ -1,54 +1,120 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
+
+create_app() builds the app. ENABLE_ADMIN (default on) and ENABLE_MIGRATIONS
+(default on under the flask CLI, off in gunicorn workers) decide whether
+Flask-Admin and Flask-Migrate are imported at all.
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from datetime import timedelta
+from flask import Flask, Blueprint, request, jsonify, url_for, current_app
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, Character, Planet, Favorite
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from utils import APIException, integrity_violation, generate_sitemap, paginate, wants_ndjson, stream_ndjson, parse_bulk_body, requested_fields, requested_sort, apply_filters, list_args, int_arg, ids_arg, route_index
+from cache import setup_cache, cached, built_once
+from bulk import bulk_create_named, bulk_create_favorites, delete_ids
+from passwords import hash_password, verify_password
+from tokens import setup_tokens, revoke_token, forget_user
+from database import engine_options, pool_status, env_flag
+from instrumentation import setup_instrumentation
+from json_provider import FastJSONProvider
+from search import search_names
+from compression import setup_compression
+from replica import setup_replica, replica_binds
+from ratelimit import setup_rate_limits, rate_limited
+from health import setup_health
+from models import db, User, Character, Planet, Favorite, serialize_rows
 #from models import Person
 from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_refresh_token
+from flask_jwt_extended import decode_token
+from flask_jwt_extended import get_jwt
+from flask_jwt_extended import current_user
 from flask_jwt_extended import get_jwt_identity
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import JWTManager
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
-
-# Setup the Flask-JWT-Extended extension
-app.config["JWT_SECRET_KEY"] = os.getenv("PASSWORD_KEY")  # Change this!
-jwt = JWTManager(app)
+api = Blueprint('api', __name__)
+
+def create_app():
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.json = FastJSONProvider(app)
+
+    # behind Render's proxy remote_addr is the proxy, take the client IP from X-Forwarded-For
+    proxy_hops = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+    if proxy_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=proxy_hops)
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.getenv("DATABASE_REPLICA_URL"), engine_options)
+
+    db.init_app(app)
+    # alembic and flask-admin are the slowest imports, only load them when they are used
+    if env_flag("ENABLE_MIGRATIONS", "1" if os.getenv("FLASK_RUN_FROM_CLI") else "0"):
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    CORS(app)
+    if env_flag("ENABLE_ADMIN", "1"):
+        from admin import setup_admin
+        setup_admin(app)
+    setup_cache(app)
+    setup_replica(app)
+    setup_instrumentation(app)
+    setup_compression(app)
+    setup_rate_limits(app)
+    setup_health(app)
+
+    # Setup the Flask-JWT-Extended extension
+    app.config["JWT_SECRET_KEY"] = os.getenv("PASSWORD_KEY")  # Change this!
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=int(os.getenv("JWT_ACCESS_TOKEN_MINUTES", 15)))
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=int(os.getenv("JWT_REFRESH_TOKEN_DAYS", 30)))
+    jwt = JWTManager(app)
+    setup_tokens(app, jwt)
+
+    app.register_blueprint(api)
+    return app
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
+    return jsonify(error.to_dict()), error.status_code, error.headers or {}
 
-# generate sitemap with all your endpoints
-@app.route('/')
+# generate sitemap with all your endpoints, once: the url map does not change after startup
+@api.route('/')
+@built_once()
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
+
+# the same as a JSON document, for monitors and clients
+@api.route('/routes')
+@built_once()
+def routes():
+    response_body = {
+        "msg": "ok",
+        "results": route_index(current_app)
+    }
+    return jsonify(response_body), 200
+
+# connection pool usage of this worker, to size DB_POOL_SIZE against the worker count
+@api.route('/stats/pool')
+def get_pool_stats():
+    return jsonify(pool_status(db.engine)), 200
 
 # ----- ENDPOINTS ------ 
 
 # Create a route to authenticate your users and return JWTs. The
 # create_access_token() function is used to actually generate the JWT.
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
+@rate_limited("login")
 def login():
     email = request.json.get("email", None)
     password = request.json.get("password", None)
@@ -61,23 +127,68 @@ def login():
     if user is None:
         return jsonify({"msg":"User does not exist"}),404
     
-    if password != user.password:
+    ok, new_hash = verify_password(user.password, password)
+    if not ok:
         return jsonify({"msg":"Wrong password"}),404
+    if new_hash is not None:
+        # legacy plaintext password or an outdated work factor
+        user.password = new_hash
+        db.session.commit()
+
+    # the identity is the user id so loading the current user is a primary key lookup
+    access_token = create_access_token(identity=str(user.id))
+    refresh_token = create_refresh_token(identity=str(user.id))
+    return jsonify(access_token=access_token, refresh_token=refresh_token)
 
-    access_token = create_access_token(identity=email)
+# Exchange a refresh token for a new access token
+@api.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    access_token = create_access_token(identity=get_jwt_identity())
     return jsonify(access_token=access_token)
 
+# Revoke the token used to call this endpoint (access or refresh), and the
+# refresh token sent in the body if any
+@api.route("/logout", methods=["POST"])
+@jwt_required(verify_type=False)
+def logout():
+    revoke_token(current_app, get_jwt())
+    request_body = request.get_json(silent=True) or {}
+    if request_body.get("refresh_token"):
+        try:
+            refresh_payload = decode_token(request_body["refresh_token"])
+        except Exception:
+            return jsonify({"msg":"Invalid refresh token"}),400
+        if refresh_payload["sub"] != get_jwt_identity():
+            return jsonify({"msg":"Invalid refresh token"}),400
+        revoke_token(current_app, refresh_payload)
+    return jsonify({"msg":"ok - Logged out"}), 200
+
 # Protect a route with jwt_required, which will kick out requests
 # without a valid JWT present.
-@app.route("/profile", methods=["GET"])
+@api.route("/profile", methods=["GET"])
 @jwt_required()
 def profile():
-    # Access the identity of the current user with get_jwt_identity
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(email=current_user).first()
-    return jsonify(logged_in_as=user.serialize()), 200
+    # current_user is resolved by the user_lookup_loader in tokens.py
+    return jsonify(logged_in_as=current_user.serialize()), 200
 
-@app.route("/signup",methods=['POST'])
+@api.route("/me/favorites", methods=["GET"])
+@jwt_required()
+def my_favorites():
+    # one query: the user's favorites joined with the character/planet they point to
+    favorites_query = Favorite.query.filter(Favorite.user_id == current_user.id).options(
+        joinedload(Favorite.character), joinedload(Favorite.planet))
+    favorites_query, next_cursor = paginate(favorites_query, Favorite)
+    favorites = list(map(lambda favorite:favorite.serialize_with_item(),favorites_query))
+    response_body = {
+        "msg": "ok",
+        "results": favorites,
+        "next": next_cursor
+    }
+    return jsonify(response_body), 200
+
+@api.route("/signup",methods=['POST'])
+@rate_limited("signup")
 def signup():
         request_body = request.get_json(force=True)
 
@@ -95,7 +206,7 @@ def signup():
         if "password" not in request_body:
             return jsonify({"msg":"password no puede estar vacio"}),400
         
-        user = User(email=request_body["email"],password=request_body["password"],is_active=request_body["is_active"])
+        user = User(email=request_body["email"],password=hash_password(request_body["password"]),is_active=request_body["is_active"])
 
         db.session.add(user)
         db.session.commit()
@@ -104,33 +215,47 @@ def signup():
         }
         return jsonify(response_body), 200
 
-@app.route('/users', methods=['GET','POST'])
+@api.route('/users', methods=['GET','POST','DELETE'])
 def get_post_users():
     if request.method == "GET":
-        users_query = User.query.all()
-        users = list(map(lambda user:user.serialize(),users_query))
+        # plain rows of the serialized columns, no ORM objects for list pages
+        users_query = User.query.with_entities(*User.serialize_columns())
+        if wants_ndjson():
+            return stream_ndjson(users_query, User)
+        users_query, next_cursor = paginate(users_query, User)
+        users = serialize_rows(users_query)
         response_body = {
             "msg": "ok",
-            "results": users
+            "results": users,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
     elif request.method == "POST":
         request_body = request.get_json(force=True)
-        user = User(email=request_body["email"],password=request_body["password"],is_active=request_body["is_active"])
-        if user is None:
-            return jsonify({"msg":"User no puede ser null"}),400
         if "email" not in request_body:
             return jsonify({"msg":"email no puede estar vacio"}),400
         if "password" not in request_body:
             return jsonify({"msg":"password no puede estar vacio"}),400
+        user = User(email=request_body["email"],password=hash_password(request_body["password"]),is_active=request_body.get("is_active", True))
         db.session.add(user)
         db.session.commit()
         response_body = {
             "msg" : "ok - User created"
         }
         return jsonify(response_body), 200
+    elif request.method == "DELETE":
+        # DELETE /users?ids=1,2,3 in one statement, their favorites are removed by the database
+        ids = ids_arg()
+        deleted = delete_ids(User, ids)
+        for user_id in ids:
+            forget_user(current_app, user_id)
+        response_body = {
+            "msg": "ok - " + str(deleted) + " deleted",
+            "deleted": deleted
+        }
+        return jsonify(response_body), 200
 
-@app.route('/users/<int:user_id>', methods=['GET','DELETE'])
+@api.route('/users/<int:user_id>', methods=['GET','DELETE'])
 def get_delete_one_user(user_id):
     user_query = User.query.filter_by(id=user_id).first()
 
@@ -150,16 +275,26 @@ def get_delete_one_user(user_id):
         }
         db.session.delete(user_query)
         db.session.commit()
+        forget_user(current_app, user_id)
         return jsonify(response_body), 200
 
-@app.route('/characters', methods=['GET','POST'])
+@api.route('/characters', methods=['GET','POST','DELETE'])
+@cached('character', list_args(Character))
 def get_post_characters():
-    if request.method == "GET":
-        characters_query = Character.query.all()
-        characters = list(map(lambda character:character.serialize(),characters_query))
+    if request.method in ("GET", "HEAD"):
+        # plain rows of the serialized (or ?fields=) columns, no ORM objects for list pages
+        fields = requested_fields(Character)
+        sort = requested_sort(Character)
+        characters_query = Character.query.with_entities(*Character.serialize_columns(fields, sort))
+        characters_query = apply_filters(characters_query, Character)
+        if wants_ndjson():
+            return stream_ndjson(characters_query, Character, fields)
+        characters_query, next_cursor = paginate(characters_query, Character, sort)
+        characters = serialize_rows(characters_query, fields)
         response_body = {
             "msg": "ok",
-            "results": characters
+            "results": characters,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
     
@@ -177,17 +312,42 @@ def get_post_characters():
         }
         return jsonify(response_body), 200
 
-@app.route('/characters/<int:character_id>', methods=['GET','DELETE'])
+    elif request.method == "DELETE":
+        # DELETE /characters?ids=1,2,3 in one statement, their favorites are removed by the database
+        deleted = delete_ids(Character, ids_arg())
+        response_body = {
+            "msg": "ok - " + str(deleted) + " deleted",
+            "deleted": deleted
+        }
+        return jsonify(response_body), 200
+
+@api.route('/characters/bulk', methods=['POST'])
+def post_bulk_characters():
+    results = bulk_create_named(Character, parse_bulk_body())
+    created = len([result for result in results if result["status"] == "created"])
+    response_body = {
+        "msg": "ok - " + str(created) + " created",
+        "results": results
+    }
+    return jsonify(response_body), 200
+
+@api.route('/characters/<int:character_id>', methods=['GET','DELETE'])
+@cached('character', ("fields",))
 def get_delete_one_character(character_id):
-    character_query = Character.query.filter_by(id=character_id).first()
+    if request.method in ("GET", "HEAD"):
+        # only the serialized (or ?fields=) columns are selected
+        fields = requested_fields(Character)
+        character_query = Character.query.with_entities(*Character.serialize_columns(fields)).filter_by(id=character_id).first()
+    else:
+        character_query = Character.query.filter_by(id=character_id).first()
 
     if character_query is None:
         return jsonify({"msg" : "Character not found"}),404
 
-    elif request.method == "GET":
+    elif request.method in ("GET", "HEAD"):
         response_body = {
             "msg": "ok",
-            "result" : character_query.serialize()
+            "result" : serialize_rows([character_query], fields)[0]
         }
         return jsonify(response_body), 200
     
@@ -199,14 +359,23 @@ def get_delete_one_character(character_id):
         db.session.commit()
         return jsonify(response_body), 200
 
-@app.route('/planets', methods=['GET','POST'])
+@api.route('/planets', methods=['GET','POST','DELETE'])
+@cached('planet', list_args(Planet))
 def get_post_planets():
-    if request.method == "GET":
-        planets_query = Planet.query.all()
-        planets = list(map(lambda planet:planet.serialize(),planets_query))
+    if request.method in ("GET", "HEAD"):
+        # plain rows of the serialized (or ?fields=) columns, no ORM objects for list pages
+        fields = requested_fields(Planet)
+        sort = requested_sort(Planet)
+        planets_query = Planet.query.with_entities(*Planet.serialize_columns(fields, sort))
+        planets_query = apply_filters(planets_query, Planet)
+        if wants_ndjson():
+            return stream_ndjson(planets_query, Planet, fields)
+        planets_query, next_cursor = paginate(planets_query, Planet, sort)
+        planets = serialize_rows(planets_query, fields)
         response_body = {
             "msg": "ok",
-            "results": planets
+            "results": planets,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
 
@@ -224,17 +393,42 @@ def get_post_planets():
         }
         return jsonify(response_body), 200
 
-@app.route('/planets/<int:planet_id>', methods=['GET','DELETE'])
+    elif request.method == "DELETE":
+        # DELETE /planets?ids=1,2,3 in one statement, their favorites are removed by the database
+        deleted = delete_ids(Planet, ids_arg())
+        response_body = {
+            "msg": "ok - " + str(deleted) + " deleted",
+            "deleted": deleted
+        }
+        return jsonify(response_body), 200
+
+@api.route('/planets/bulk', methods=['POST'])
+def post_bulk_planets():
+    results = bulk_create_named(Planet, parse_bulk_body())
+    created = len([result for result in results if result["status"] == "created"])
+    response_body = {
+        "msg": "ok - " + str(created) + " created",
+        "results": results
+    }
+    return jsonify(response_body), 200
+
+@api.route('/planets/<int:planet_id>', methods=['GET','DELETE'])
+@cached('planet', ("fields",))
 def get_delete_one_planet(planet_id):
-    planet_query = Planet.query.filter_by(id=planet_id).first()
+    if request.method in ("GET", "HEAD"):
+        # only the serialized (or ?fields=) columns are selected
+        fields = requested_fields(Planet)
+        planet_query = Planet.query.with_entities(*Planet.serialize_columns(fields)).filter_by(id=planet_id).first()
+    else:
+        planet_query = Planet.query.filter_by(id=planet_id).first()
 
     if planet_query is None:
         return jsonify({"msg" : "Planet not found"}),404
 
-    elif request.method == "GET":
+    elif request.method in ("GET", "HEAD"):
         response_body = {
             "msg": "ok",
-            "result" : planet_query.serialize()
+            "result" : serialize_rows([planet_query], fields)[0]
         }
         return jsonify(response_body), 200
     
@@ -242,42 +436,80 @@ def get_delete_one_planet(planet_id):
         response_body = {
             "msg": "ok - Planet deleted"
         }
-        favorites_query = Favorite
         db.session.delete(planet_query)
         db.session.commit()
         return jsonify(response_body), 200
 
-@app.route('/favorites', methods=['GET','POST'])
+@api.route('/search', methods=['GET'])
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"msg":"q cannot be empty"}),400
+    limit = int_arg("limit", 10, minimum=1, maximum=50)
+    response_body = {
+        "msg": "ok",
+        "results": search_names(query, limit)
+    }
+    return jsonify(response_body), 200
+
+@api.route('/favorites', methods=['GET','POST'])
 def get_post_favorites():
     if request.method == "GET":
-        favorites_query = Favorite.query.all()
-        favorites = list(map(lambda favorite:favorite.serialize(),favorites_query))
+        # plain rows of the serialized columns, no ORM objects for list pages
+        favorites_query = Favorite.query.with_entities(*Favorite.serialize_columns())
+        if wants_ndjson():
+            return stream_ndjson(favorites_query, Favorite)
+        favorites_query, next_cursor = paginate(favorites_query, Favorite)
+        favorites = serialize_rows(favorites_query)
         response_body = {
             "msg": "ok",
-            "results": favorites
+            "results": favorites,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
     
     elif request.method == "POST":
         request_body = request.get_json(force=True)
-        exists = Favorite.query.filter_by(user_id=request_body["user_id"],character_id=request_body["character_id"],planet_id=request_body["planet_id"]).first()
-        if exists != None:
-            return jsonify({"msg":"Already exists"}),400
-        favorite = Favorite(user_id=request_body["user_id"],character_id=request_body["character_id"],planet_id=request_body["planet_id"])
+        favorite = Favorite(user_id=request_body.get("user_id"),character_id=request_body.get("character_id"),planet_id=request_body.get("planet_id"))
         if favorite.user_id is None:
             return jsonify({"msg":"No user was selected"}),400
         if favorite.character_id is None and favorite.planet_id is None:
             return jsonify({"msg":"No character or planet was selected"}),400
         if favorite.character_id is not None and favorite.planet_id is not None:
             return jsonify({"msg":"Multiple items selected"}),400
+        # the unique indexes on favorite reject duplicates and the foreign keys
+        # unknown users/items, no SELECT needed first
+        references = ((User, favorite.user_id), (Character, favorite.character_id), (Planet, favorite.planet_id))
         db.session.add(favorite)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            violation = integrity_violation(error)
+            if violation == "unique":
+                return jsonify({"msg":"Already exists"}),400
+            if violation == "foreign_key":
+                # only on this error path: find which of the referenced rows is missing
+                for model, id in references:
+                    if id is not None and db.session.get(model, id) is None:
+                        return jsonify({"msg":model.__name__ + " not found"}),404
+            raise
         response_body = {
             "msg" : "ok - Favorite created"
         }
         return jsonify(response_body), 200
 
-@app.route('/favorites/<int:favorite_id>', methods=['GET','DELETE'])
+@api.route('/favorites/bulk', methods=['POST'])
+def post_bulk_favorites():
+    results = bulk_create_favorites(parse_bulk_body())
+    created = len([result for result in results if result["status"] == "created"])
+    response_body = {
+        "msg": "ok - " + str(created) + " created",
+        "results": results
+    }
+    return jsonify(response_body), 200
+
+@api.route('/favorites/<int:favorite_id>', methods=['GET','DELETE'])
 def get_delete_one_favorite(favorite_id):
     favorite_query = Favorite.query.filter_by(id=favorite_id).first()
 
@@ -299,6 +531,9 @@ def get_delete_one_favorite(favorite_id):
         db.session.commit()
         return jsonify(response_body), 200
 
+# wsgi.py and the flask CLI (FLASK_APP=src/app.py) use this instance
+app = create_app()
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,151 @@
+"""
+Bulk inserts for the catalog and favorites: validate every row first, then
+insert the valid ones in batches (executemany) inside a single transaction.
+Each input row gets its own result so a conflict never aborts the whole batch.
+Bulk deletes are a single DELETE ... WHERE id IN (...).
+"""
+from sqlalchemy import insert, delete, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Character, Planet, Favorite
+from utils import APIException
+
+# rows per INSERT executemany / per IN (...) lookup
+BATCH_SIZE = 500
+
+def chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def validate_row(model, row):
+    # returns (values, error) using the model columns as the schema
+    if not isinstance(row, dict):
+        return None, "row must be an object"
+    values = {}
+    for column in model.__table__.columns:
+        if column.primary_key:
+            continue
+        value = row.get(column.name)
+        if value is None:
+            if not column.nullable:
+                return None, column.name + " cannot be null"
+        elif column.type.python_type is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                return None, column.name + " must be an integer"
+        elif not isinstance(value, column.type.python_type):
+            return None, column.name + " must be a " + column.type.python_type.__name__
+        values[column.name] = value
+    return values, None
+
+def insert_rows(model, rows):
+    for chunk in chunks(rows):
+        db.session.execute(insert(model), chunk)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # somebody inserted the same keys between our check and the insert
+        db.session.rollback()
+        raise APIException("conflict while inserting, retry the request", status_code=409)
+
+def bulk_create_named(model, rows):
+    # Character and Planet: unique on name
+    results = []
+    valid = []
+    seen = set()
+    for index, row in enumerate(rows):
+        values, error = validate_row(model, row)
+        if error is not None:
+            results.append({"index": index, "status": "error", "msg": error})
+        elif values["name"] in seen:
+            results.append({"index": index, "status": "conflict", "msg": "duplicated name in request"})
+        else:
+            seen.add(values["name"])
+            valid.append((index, values))
+            results.append(None)
+
+    existing = set()
+    for chunk in chunks([values["name"] for index, values in valid]):
+        existing.update(name for (name,) in db.session.query(model.name).filter(model.name.in_(chunk)))
+
+    to_insert = []
+    for index, values in valid:
+        if values["name"] in existing:
+            results[index] = {"index": index, "status": "conflict", "msg": "name already exists"}
+        else:
+            results[index] = {"index": index, "status": "created", "name": values["name"]}
+            to_insert.append(values)
+
+    if to_insert:
+        insert_rows(model, to_insert)
+    return results
+
+def existing_ids(model, ids):
+    found = set()
+    for chunk in chunks(list(ids)):
+        found.update(id for (id,) in db.session.query(model.id).filter(model.id.in_(chunk)))
+    return found
+
+def existing_favorites(item_column, pairs):
+    # (user_id, item_id) pairs already favorited, one row-value IN (...) per chunk
+    found = set()
+    for chunk in chunks(list(pairs)):
+        query = db.session.query(Favorite.user_id, item_column).filter(
+            tuple_(Favorite.user_id, item_column).in_(chunk))
+        found.update(tuple(row) for row in query)
+    return found
+
+def bulk_create_favorites(rows):
+    results = []
+    valid = []
+    seen = set()
+    for index, row in enumerate(rows):
+        values, error = validate_row(Favorite, row)
+        if error is None and values.get("character_id") is None and values.get("planet_id") is None:
+            error = "No character or planet was selected"
+        if error is None and values.get("character_id") is not None and values.get("planet_id") is not None:
+            error = "Multiple items selected"
+        if error is not None:
+            results.append({"index": index, "status": "error", "msg": error})
+            continue
+        key = (values["user_id"], values.get("character_id"), values.get("planet_id"))
+        if key in seen:
+            results.append({"index": index, "status": "conflict", "msg": "duplicated favorite in request"})
+            continue
+        seen.add(key)
+        valid.append((index, key))
+        results.append(None)
+
+    # referenced rows, a few IN (...) queries in total
+    users = existing_ids(User, {key[0] for index, key in valid})
+    characters = existing_ids(Character, {key[1] for index, key in valid if key[1] is not None})
+    planets = existing_ids(Planet, {key[2] for index, key in valid if key[2] is not None})
+    # a favorite has a single item, so each item column is matched on its own
+    existing = {(user_id, character_id, None) for user_id, character_id in existing_favorites(
+        Favorite.character_id, {(key[0], key[1]) for index, key in valid if key[1] is not None})}
+    existing.update((user_id, None, planet_id) for user_id, planet_id in existing_favorites(
+        Favorite.planet_id, {(key[0], key[2]) for index, key in valid if key[2] is not None}))
+
+    to_insert = []
+    for index, key in valid:
+        user_id, character_id, planet_id = key
+        if user_id not in users:
+            results[index] = {"index": index, "status": "error", "msg": "User not found"}
+        elif character_id is not None and character_id not in characters:
+            results[index] = {"index": index, "status": "error", "msg": "Character not found"}
+        elif planet_id is not None and planet_id not in planets:
+            results[index] = {"index": index, "status": "error", "msg": "Planet not found"}
+        elif key in existing:
+            results[index] = {"index": index, "status": "conflict", "msg": "Already exists"}
+        else:
+            results[index] = {"index": index, "status": "created"}
+            to_insert.append({"user_id": user_id, "character_id": character_id, "planet_id": planet_id})
+
+    if to_insert:
+        insert_rows(Favorite, to_insert)
+    return results
+
+def delete_ids(model, ids):
+    # the database removes the dependent favorites (ON DELETE CASCADE), nothing is loaded here
+    statement = delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+    deleted = db.session.execute(statement).rowcount
+    db.session.commit()
+    return deleted
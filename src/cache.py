@@ -0,0 +1,286 @@
+"""
+Response cache for the read-mostly catalog endpoints (characters and planets).
+
+Cached entries are keyed by table version + request path + the query string
+arguments the view reads (sorted, others are ignored). Every committed
+write to a cached table bumps its version, from the session events below, so
+routes, bulk statements and Flask-Admin edits alike make old entries unreachable.
+Two backends: an in-process LRU (per gunicorn worker, default), bounded by
+entry count and by the bytes of the bodies it holds, and a Redis compatible one
+shared between workers. Entries also keep their gzip/brotli
+bodies, compressed the first time a client asks for that encoding.
+
+With a read replica, requests routed to the primary (read-your-writes) skip
+the cache, and replica reads within REPLICA_STICKY_SECONDS of a write are not
+stored, the replica may not have that write yet.
+
+@built_once is for responses that cannot change while the app runs (the
+sitemap and route index): the view runs once per app, later hits come from memory.
+"""
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from utils import wants_ndjson
+from compression import MIN_SIZE, negotiate_encoding, compress_body
+from replica import STICKY_SECONDS, READ_METHODS, RoutingSession
+
+# tables with @cached views, only their writes bump a version
+CACHED_TABLES = set()
+
+def entry_size(entry):
+    # bytes of the body and of its compressed copies, the rest of an entry is small
+    return len(entry["body"]) + sum(len(body) for body in entry.get("encoded", {}).values())
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=60, max_bytes=None):
+        # the ttl bounds how long another worker can serve an entry after a write
+        # it did not see, versions are only shared inside this process.
+        # max_bytes only applies to response entries (see entry_size)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires, value, size)
+        self.size = 0
+        self.versions = {}
+        self.bumps = {}  # table -> unix time of the last bump
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            expires, value, size = item
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.size -= size
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = entry_size(value) if self.max_bytes is not None else 0
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+                self.size -= self.entries.popitem(last=False)[1][2]
+
+    def delete(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+
+    def version(self, table):
+        return self.versions.get(table, 0)
+
+    def bump(self, table):
+        with self.lock:
+            self.versions[table] = self.versions.get(table, 0) + 1
+            self.bumps[table] = time.time()
+
+    def bumped_at(self, table):
+        return self.bumps.get(table, 0.0)
+
+class RedisCache:
+    # works with any client exposing get/set(ex=)/delete/incr, e.g. redis.Redis or fakeredis
+    def __init__(self, client, ttl=3600, prefix="swapi:cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def version(self, table):
+        value = self.client.get(self.prefix + "version:" + table)
+        return int(value) if value is not None else 0
+
+    def bump(self, table):
+        self.client.incr(self.prefix + "version:" + table)
+        self.client.set(self.prefix + "bumped:" + table, repr(time.time()), ex=self.ttl)
+
+    def bumped_at(self, table):
+        value = self.client.get(self.prefix + "bumped:" + table)
+        return float(value) if value is not None else 0.0
+
+def redis_client_from_env(name):
+    # redis is an optional dependency, only imported when a backend asks for it
+    import redis
+    return redis.Redis.from_url(os.environ[name])
+
+def setup_cache(app):
+    backend = os.getenv("CACHE_BACKEND", "lru")
+    if backend == "lru":
+        cache = LRUCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 1024)),
+                         ttl=int(os.getenv("CACHE_TTL", 60)),
+                         max_bytes=int(os.getenv("CACHE_MAX_MB", 32)) * 1024 * 1024)
+    elif backend == "redis":
+        cache = RedisCache(redis_client_from_env("CACHE_REDIS_URL"),
+                           ttl=int(os.getenv("CACHE_TTL", 3600)))
+    elif backend == "none":
+        cache = None
+    else:
+        raise ValueError("Unknown CACHE_BACKEND " + backend)
+    app.extensions["response_cache"] = cache
+    return cache
+
+def written_tables(session):
+    return session.info.setdefault("cache_written_tables", set())
+
+@event.listens_for(RoutingSession, "after_flush")
+def remember_flushed_tables(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(type(obj), "__tablename__", None)
+        if table in CACHED_TABLES:
+            written_tables(session).add(table)
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def remember_executed_tables(orm_execute_state):
+    # session.execute(insert/update/delete(Model)) never goes through a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table.name in CACHED_TABLES:
+            written_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+@event.listens_for(RoutingSession, "after_commit")
+def bump_written_tables(session):
+    tables = session.info.pop("cache_written_tables", None)
+    cache = current_app.extensions.get("response_cache") if has_app_context() else None
+    if tables and cache is not None:
+        for table in tables:
+            cache.bump(table)
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def forget_written_tables(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop("cache_written_tables", None)
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 300))
+
+def make_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def encoded_body(entry):
+    # returns (body, encoding, added), added is True when a new compressed body was stored in entry
+    if not current_app.extensions.get("compression") or len(entry["body"]) < MIN_SIZE:
+        return entry["body"], None, False
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return entry["body"], None, False
+    encoded = entry.setdefault("encoded", {})
+    added = encoding not in encoded
+    if added:
+        encoded[encoding] = compress_body(entry["body"], encoding)
+    return encoded[encoding], encoding, added
+
+def cached_response(entry, body, encoding):
+    response = current_app.response_class(body, status=200, mimetype=entry["mimetype"])
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+        response.set_etag(entry["etag"] + "-" + encoding)
+    else:
+        response.set_etag(entry["etag"])
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add("Accept")
+    if current_app.extensions.get("compression"):
+        response.vary.add("Accept-Encoding")
+    # answers If-None-Match with an empty 304
+    return response.make_conditional(request)
+
+def request_key(table, version, arg_names):
+    # unknown arguments (?x=1) map to the same entry instead of a new one each
+    query = urlencode(sorted((name, value) for name in arg_names for value in request.args.getlist(name)))
+    return table + ":v" + str(version) + ":" + request.path + "?" + query
+
+def cached(table, arg_names=()):
+    # GET/HEAD responses are cached under the table version, the session
+    # events above invalidate it when a write to the table is committed.
+    # arg_names are the query string arguments the view reads
+    CACHED_TABLES.add(table)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get("response_cache")
+            if cache is None:
+                return view(*args, **kwargs)
+
+            if request.method not in READ_METHODS:
+                return view(*args, **kwargs)
+
+            # streamed responses are never buffered into the cache, and callers
+            # routed to the primary to read their own writes must not get replica data
+            route = g.get("db_route")
+            if wants_ndjson() or route == "primary":
+                return view(*args, **kwargs)
+
+            key = request_key(table, cache.version(table), arg_names)
+            entry = cache.get(key)
+            stored = entry is not None
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = {"body": body, "mimetype": response.mimetype, "etag": make_etag(body)}
+            body, encoding, added = encoded_body(entry)
+            if stored:
+                if added:
+                    cache.set(key, entry)
+            elif route != "replica" or time.time() - cache.bumped_at(table) >= STICKY_SECONDS:
+                # a replica read right after a write may predate it, it is served but not stored
+                cache.set(key, entry)
+            return cached_response(entry, body, encoding)
+        return wrapper
+    return decorator
+
+def built_once(max_age=STATIC_MAX_AGE):
+    # the first successful response of the view is kept for the life of the app,
+    # in app.extensions so each app built by create_app() answers with its own routes
+    def decorator(view):
+        lock = threading.Lock()
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            entries = current_app.extensions.setdefault("built_once", {})
+            key = (request.endpoint, request.path)
+            entry = entries.get(key)
+            if entry is None:
+                with lock:
+                    entry = entries.get(key)
+                    if entry is None:
+                        response = current_app.make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        body = response.get_data()
+                        entry = {"body": body, "mimetype": response.mimetype, "etag": make_etag(body)}
+                        entries[key] = entry
+            body, encoding, added = encoded_body(entry)
+            response = cached_response(entry, body, encoding)
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = max_age
+            return response
+        return wrapper
+    return decorator
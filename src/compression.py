@@ -0,0 +1,62 @@
+"""
+gzip / brotli response compression negotiated with Accept-Encoding.
+
+Bodies under COMPRESS_MIN_SIZE bytes are sent as they are. brotli is an
+optional dependency and is only offered when installed. Cached catalog
+responses (cache.py) store their compressed bodies, so those are compressed
+once per cache entry and not on every hit.
+"""
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/html", "text/plain")
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate_encoding():
+    return request.accept_encodings.best_match(ENCODINGS)
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so the ETag) stable for the same body
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def is_compressible(response):
+    return response.status_code == 200 and not response.is_streamed and not response.direct_passthrough \
+        and response.mimetype in COMPRESSIBLE_MIMETYPES and "Content-Encoding" not in response.headers
+
+def setup_compression(app):
+    app.extensions["compression"] = False
+    if os.getenv("COMPRESSION", "1").lower() in ("0", "false", "no", "off"):
+        return False
+
+    @app.after_request
+    def compress_response(response):
+        if not is_compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+        response.set_data(compress_body(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            # each encoding is a different representation
+            response.set_etag(etag + "-" + encoding, weak=weak)
+        return response
+
+    app.extensions["compression"] = True
+    return True
@@ -0,0 +1,113 @@
+"""
+Connection pool settings (SQLALCHEMY_ENGINE_OPTIONS) read from the environment,
+and pool checkout metrics to size the pool against the number of workers.
+
+DB_POOL_MODE=queue (default) keeps a pool per worker:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s), DB_POOL_PRE_PING
+DB_POOL_MODE=pgbouncer disables our pool (NullPool) so an external pooler in
+transaction mode owns the connections.
+DB_STATEMENT_TIMEOUT_MS sets statement_timeout on new Postgres connections
+(with pgbouncer set it on the role instead, it rejects startup options).
+SQLite connections get PRAGMA foreign_keys=ON so ON DELETE CASCADE applies there too.
+"""
+import os
+import time
+import sqlite3
+import threading
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, NullPool
+
+pool_stats = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "invalidations": 0,
+    "timeouts": 0,
+    "checkout_wait_seconds_total": 0.0,
+    "checkout_wait_seconds_max": 0.0,
+}
+pool_stats_lock = threading.Lock()
+
+def count(name, amount=1):
+    with pool_stats_lock:
+        pool_stats[name] += amount
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that measures how long a checkout waited for a free connection
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            count("timeouts")
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with pool_stats_lock:
+                pool_stats["checkout_wait_seconds_total"] += waited
+                pool_stats["checkout_wait_seconds_max"] = max(pool_stats["checkout_wait_seconds_max"], waited)
+
+@event.listens_for(TimedQueuePool, "connect")
+def on_connect(dbapi_connection, connection_record):
+    count("connects")
+
+@event.listens_for(TimedQueuePool, "checkout")
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    count("checkouts")
+
+@event.listens_for(TimedQueuePool, "checkin")
+def on_checkin(dbapi_connection, connection_record):
+    count("checkins")
+
+@event.listens_for(TimedQueuePool, "invalidate")
+def on_invalidate(dbapi_connection, connection_record, exception):
+    count("invalidations")
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys, and so ON DELETE CASCADE, unless every connection asks for them
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+def engine_options(database_uri):
+    if database_uri.startswith("sqlite"):
+        # local development database, SQLAlchemy's defaults are fine
+        return {}
+
+    options = {}
+    if os.getenv("DB_POOL_MODE", "queue") == "pgbouncer":
+        options["poolclass"] = NullPool
+    else:
+        options.update({
+            "poolclass": TimedQueuePool,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 5)),
+            "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 10)),
+            # Render's Postgres drops idle connections, recycle before it does
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 300)),
+            "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "true"),
+        })
+        statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+        if statement_timeout and database_uri.startswith("postgresql"):
+            options["connect_args"] = {"options": "-c statement_timeout=%d" % int(statement_timeout)}
+    return options
+
+def pool_status(engine):
+    with pool_stats_lock:
+        stats = dict(pool_stats)
+    pool = engine.pool
+    stats["pool_class"] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    return stats
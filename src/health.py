@@ -0,0 +1,84 @@
+"""
+/healthz (liveness) and /readyz (readiness) for the load balancer.
+
+Both are answered by a WSGI middleware in front of Flask, so probes skip
+routing, JWT, CORS, instrumentation, replica routing and compression.
+/healthz never touches the database. /readyz runs SELECT 1 on a pooled
+connection with a READY_TIMEOUT_MS timeout and keeps the result for
+READY_CACHE_SECONDS. At most one check per worker is in flight, so probes
+can never take more than one connection from the pool.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from models import db
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT_MS", 1000)) / 1000
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", 2))
+PROBE_METHODS = ("GET", "HEAD")
+
+class HealthChecks:
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.engine = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readyz")
+        self.lock = threading.Lock()
+        self.pending = None
+        self.state = {"ready": False, "error": "not checked yet", "checked_at": None}
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") in PROBE_METHODS:
+            if path == "/healthz":
+                return self.respond(environ, start_response, True, None)
+            if path == "/readyz":
+                ready, error = self.readiness()
+                return self.respond(environ, start_response, ready, error)
+        return self.wsgi_app(environ, start_response)
+
+    def respond(self, environ, start_response, ok, error):
+        if ok:
+            status, body = "200 OK", b'{"status":"ok"}'
+        else:
+            status, body = "503 Service Unavailable", ('{"status":"unavailable","error":"%s"}' % error).encode()
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body))),
+                                ("Cache-Control", "no-store")])
+        return [b""] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+    def ping(self):
+        if self.engine is None:
+            with self.app.app_context():
+                self.engine = db.engine
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+
+    def readiness(self):
+        checked_at = self.state["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < READY_CACHE_SECONDS:
+            return self.state["ready"], self.state["error"]
+        # a probe already checking: answer with the last result instead of waiting
+        if not self.lock.acquire(blocking=False):
+            return self.state["ready"], self.state["error"]
+        try:
+            if self.pending is not None and not self.pending.done():
+                # the previous check is still stuck on the database, do not queue another one
+                ready, error = False, "timeout"
+            else:
+                self.pending = self.executor.submit(self.ping)
+                try:
+                    self.pending.result(timeout=READY_TIMEOUT)
+                    ready, error = True, None
+                except FutureTimeout:
+                    ready, error = False, "timeout"
+                except Exception as exception:
+                    ready, error = False, type(exception).__name__
+            self.state.update(ready=ready, error=error, checked_at=time.monotonic())
+            return ready, error
+        finally:
+            self.lock.release()
+
+def setup_health(app):
+    app.wsgi_app = HealthChecks(app.wsgi_app, app)
+    return app.wsgi_app
@@ -0,0 +1,115 @@
+"""
+Opt-in per-request instrumentation (INSTRUMENTATION=1).
+
+Every request records wall time, time spent in SQL and the number of queries
+(from before/after_cursor_execute on the db engines). They are sent back in a
+Server-Timing header and kept as Prometheus histograms served on /metrics,
+queries slower than SLOW_QUERY_MS are logged. Metrics are per gunicorn worker.
+"""
+import os
+import time
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from models import db
+from database import pool_stats, pool_stats_lock
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    def __init__(self, name, description, buckets, labels):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}  # label values -> [count per bucket..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s histogram" % self.name]
+        with self.lock:
+            items = sorted(self.series.items())
+        for label_values, series in items:
+            labels = ",".join('%s="%s"' % (name, value) for name, value in zip(self.labels, label_values))
+            for index, bound in enumerate(self.buckets):
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, labels, bound, series[index]))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (self.name, labels, series[-1]))
+            lines.append("%s_sum{%s} %f" % (self.name, labels, series[-2]))
+            lines.append("%s_count{%s} %d" % (self.name, labels, series[-1]))
+        return lines
+
+request_duration = Histogram("http_request_duration_seconds", "Request wall time.",
+                             LATENCY_BUCKETS, ("endpoint", "method", "status"))
+request_db_duration = Histogram("http_request_db_duration_seconds", "Time spent in SQL per request.",
+                                LATENCY_BUCKETS, ("endpoint", "method"))
+request_queries = Histogram("http_request_sql_queries", "SQL statements executed per request.",
+                            QUERY_COUNT_BUCKETS, ("endpoint", "method"))
+
+def render_metrics():
+    lines = []
+    for histogram in (request_duration, request_db_duration, request_queries):
+        lines.extend(histogram.render())
+    with pool_stats_lock:
+        stats = dict(pool_stats)
+    for name, value in sorted(stats.items()):
+        lines.append("# TYPE db_pool_%s %s" % (name, "gauge" if name.endswith("_max") else "counter"))
+        lines.append("db_pool_%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+def setup_instrumentation(app):
+    if os.getenv("INSTRUMENTATION", "0").lower() not in ("1", "true", "yes", "on"):
+        return False
+    slow_query_seconds = float(os.getenv("SLOW_QUERY_MS", 200)) / 1000
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        if has_request_context() and "db_time" in g:
+            g.db_time += elapsed
+            g.db_queries += 1
+        if elapsed >= slow_query_seconds:
+            app.logger.warning("slow query %.1fms: %s", elapsed * 1000, statement)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.db_time = 0.0
+        g.db_queries = 0
+
+    @app.after_request
+    def record_timing(response):
+        if "request_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_duration.observe((endpoint, request.method, str(response.status_code)), elapsed)
+        request_db_duration.observe((endpoint, request.method), g.db_time)
+        request_queries.observe((endpoint, request.method), g.db_queries)
+        response.headers["Server-Timing"] = 'db;dur=%.2f;desc="%d queries", total;dur=%.2f' % (
+            g.db_time * 1000, g.db_queries, elapsed * 1000)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    return True
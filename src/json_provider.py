@@ -0,0 +1,56 @@
+"""
+Faster JSON encoding for jsonify(): orjson when it is installed (it is in the
+Pipfile), then msgspec, otherwise Flask's stdlib provider. Every backend honours
+sort_keys, so the bytes (and the cache ETags) are the same whichever one runs.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        if orjson is not None:
+            self.backend = "orjson"
+        elif msgspec is not None:
+            self.backend = "msgspec"
+            self.encoder = msgspec.json.Encoder(enc_hook=self.default)
+            self.sorted_encoder = msgspec.json.Encoder(enc_hook=self.default, order="sorted")
+        else:
+            self.backend = "json"
+
+    def dump_bytes(self, obj, **kwargs):
+        # kwargs means a caller wants stdlib options (indent, sort_keys...)
+        if kwargs or self.backend == "json":
+            return super().dumps(obj, **kwargs).encode()
+        if self.backend == "orjson":
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+            return orjson.dumps(obj, default=self.default, option=option)
+        return (self.sorted_encoder if self.sort_keys else self.encoder).encode(obj)
+
+    def dumps(self, obj, **kwargs):
+        return self.dump_bytes(obj, **kwargs).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or self.backend == "json":
+            return super().loads(s, **kwargs)
+        if self.backend == "orjson":
+            return orjson.loads(s)
+        try:
+            return msgspec.json.decode(s)
+        except msgspec.DecodeError as error:
+            # request.get_json() turns ValueError into a 400
+            raise ValueError(str(error))
+
+    def response(self, *args, **kwargs):
+        # same as the default provider but without the bytes -> str -> bytes round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dump_bytes(obj), mimetype=self.mimetype)
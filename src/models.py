@@ -1,13 +1,52 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from replica import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession sends the SELECTs of read requests to the replica bind, when there is one
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
-class User(db.Model):
+# the gin_trgm_ops indexes below need the extension before db.create_all() creates them
+event.listen(db.metadata, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+class SerializeMixin:
+    # columns returned by serialize(), so list endpoints can select them as
+    # plain rows and skip building ORM objects
+    serialize_fields = ()
+
+    # query string filters and sorts allowed on the list endpoint, all indexed
+    filter_fields = ()
+    range_fields = ()
+    sort_fields = ()
+
+    @classmethod
+    def serialize_columns(cls, fields=None, sort=None):
+        # id (and the sort column) are always selected, pagination needs them for the next cursor
+        fields = fields or cls.serialize_fields
+        columns = [getattr(cls, field) for field in fields]
+        for required in ("id", sort[0] if sort else None):
+            if required is not None and required not in fields:
+                columns.append(getattr(cls, required))
+        return columns
+
+def serialize_rows(rows, fields=None):
+    # Row tuples -> dicts, keyed by the selected column names or only `fields`
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    if fields is None or tuple(fields) == tuple(keys):
+        return [dict(zip(keys, row)) for row in rows]
+    positions = [keys.index(field) for field in fields]
+    return [{field: row[position] for field, position in zip(fields, positions)} for row in rows]
+
+class User(SerializeMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(80), unique=False, nullable=False)
+    # salted hash, see passwords.py
+    password = db.Column(db.String(255), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
-    favorites = db.relationship('Favorite',backref='user',lazy=True)
+    favorites = db.relationship('Favorite',backref='user',lazy=True,cascade='all, delete',passive_deletes=True)
+    serialize_fields = ("id", "email", "is_active")
 
     def __repr__(self):
         return '<User %r>' % self.id
@@ -20,7 +59,7 @@ class User(db.Model):
             # do not serialize the password, its a security breach
         }
     
-class Planet(db.Model):
+class Planet(SerializeMixin, db.Model):
     id = db.Column(db.Integer,primary_key=True)
     name = db.Column(db.String(250),unique = True,nullable=False)
     rotation_period = db.Column(db.Integer,nullable=True)
@@ -31,7 +70,23 @@ class Planet(db.Model):
     terrain = db.Column(db.String(250),nullable=True)
     surface_water = db.Column(db.String(250),nullable=True)
     population = db.Column(db.BigInteger,nullable=True)
-    favorite_of = db.relationship('Favorite',backref='planet',lazy=True)
+    favorite_of = db.relationship('Favorite',backref='planet',lazy=True,cascade='all, delete',passive_deletes=True)
+    serialize_fields = ("id", "name", "rotation_period", "orbital_period", "diameter", "climate",
+                        "gravity", "terrain", "surface_water", "population")
+    filter_fields = ("climate", "terrain")
+    range_fields = ("population", "diameter")
+    sort_fields = ("name", "population", "diameter")
+
+    __table_args__ = (
+        db.Index('ix_planet_climate', 'climate'),
+        db.Index('ix_planet_terrain', 'terrain'),
+        # (column, id) matches the keyset order of ?sort=
+        db.Index('ix_planet_population_id', 'population', 'id'),
+        db.Index('ix_planet_diameter_id', 'diameter', 'id'),
+        # /search on Postgres, see search.py
+        db.Index('ix_planet_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+                 info={'dialect': 'postgresql'}).ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
         return '<Planet %r>' % self.id
@@ -51,7 +106,7 @@ class Planet(db.Model):
             # do not serialize the password, its a security breach
         }
 
-class Character(db.Model):
+class Character(SerializeMixin, db.Model):
     id = db.Column(db.Integer,primary_key=True)
     name = db.Column(db.String(250),unique = True,nullable=False)
     height = db.Column(db.Integer,nullable=True)
@@ -61,7 +116,23 @@ class Character(db.Model):
     eye_color = db.Column(db.String(250),nullable=True)
     birth_year = db.Column(db.String(250),nullable=True)
     gender = db.Column(db.String(250),nullable=True)
-    favorite_of = db.relationship('Favorite',backref='character',lazy=True)
+    favorite_of = db.relationship('Favorite',backref='character',lazy=True,cascade='all, delete',passive_deletes=True)
+    serialize_fields = ("id", "name", "height", "mass", "hair_color", "skin_color", "eye_color",
+                        "birth_year", "gender")
+    filter_fields = ("gender", "eye_color")
+    range_fields = ("height", "mass")
+    sort_fields = ("name", "height", "mass")
+
+    __table_args__ = (
+        db.Index('ix_character_gender', 'gender'),
+        db.Index('ix_character_eye_color', 'eye_color'),
+        # (column, id) matches the keyset order of ?sort=
+        db.Index('ix_character_height_id', 'height', 'id'),
+        db.Index('ix_character_mass_id', 'mass', 'id'),
+        # /search on Postgres, see search.py
+        db.Index('ix_character_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+                 info={'dialect': 'postgresql'}).ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
         return '<Character %r>' % self.id
@@ -80,11 +151,26 @@ class Character(db.Model):
             # do not serialize the password, its a security breach
         }
 
-class Favorite(db.Model):
+class Favorite(SerializeMixin, db.Model):
     id = db.Column(db.Integer,primary_key=True)
-    user_id = db.Column(db.Integer,db.ForeignKey('user.id'),nullable = False)
-    character_id = db.Column(db.Integer,db.ForeignKey('character.id'),nullable = True)
-    planet_id = db.Column(db.Integer,db.ForeignKey('planet.id'),nullable = True)
+    user_id = db.Column(db.Integer,db.ForeignKey('user.id',ondelete='CASCADE'),nullable = False)
+    character_id = db.Column(db.Integer,db.ForeignKey('character.id',ondelete='CASCADE'),nullable = True)
+    planet_id = db.Column(db.Integer,db.ForeignKey('planet.id',ondelete='CASCADE'),nullable = True)
+    serialize_fields = ("id", "character_id", "planet_id", "user_id")
+
+    __table_args__ = (
+        # per-user lookups and the backrefs on Planet/Character
+        db.Index('ix_favorite_user_id', 'user_id'),
+        db.Index('ix_favorite_character_id', 'character_id'),
+        db.Index('ix_favorite_planet_id', 'planet_id'),
+        # a user can favorite each character/planet only once, enforced by the DB
+        db.Index('uq_favorite_user_character', 'user_id', 'character_id', unique=True,
+                 postgresql_where=db.text('character_id IS NOT NULL'),
+                 sqlite_where=db.text('character_id IS NOT NULL')),
+        db.Index('uq_favorite_user_planet', 'user_id', 'planet_id', unique=True,
+                 postgresql_where=db.text('planet_id IS NOT NULL'),
+                 sqlite_where=db.text('planet_id IS NOT NULL')),
+    )
 
     def __repr__(self):
         return '<Favorites %r>' % self.id
@@ -96,4 +182,11 @@ class Favorite(db.Model):
             "planet_id": self.planet_id,
             "user_id": self.user_id
             # do not serialize the password, its a security breach
-        }
\ No newline at end of file
+        }
+
+    def serialize_with_item(self):
+        # expects character/planet to be eager loaded by the caller
+        data = self.serialize()
+        data["character"] = self.character.serialize() if self.character is not None else None
+        data["planet"] = self.planet.serialize() if self.planet is not None else None
+        return data
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Salted password hashing for User.password (werkzeug scrypt/pbkdf2).
+
+Hashing is CPU heavy on purpose, so only a few hash/verify calls run at once
+per worker, fewer than its request threads (GUNICORN_THREADS) so at least one
+thread keeps serving the catalog endpoints. Other callers wait up to
+PASSWORD_HASH_WAIT seconds for their turn, then get a 503. Legacy plaintext
+rows are rehashed on the next successful login, and so are hashes made with an
+older work factor.
+
+Under GUNICORN_WORKER_CLASS=gevent hashing blocks the worker's event loop, the
+limit only bounds how many logins run at once, it does not isolate them.
+"""
+import os
+import hmac
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils import APIException
+
+# any werkzeug method string, the numbers are the work factor:
+# "scrypt:32768:8:1" (n, r, p) or "pbkdf2:sha256:600000" (iterations)
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# hashes running at the same time, on the request thread, and how long (s) others wait for one
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+HASH_WAIT = float(os.getenv("PASSWORD_HASH_WAIT", 2))
+# keep one request thread free for everything else
+REQUEST_THREADS = int(os.getenv("GUNICORN_THREADS", 4))
+HASH_SLOTS = max(1, min(HASH_WORKERS, REQUEST_THREADS - 1))
+HASH_PREFIXES = ("scrypt:", "pbkdf2:")
+
+slots = threading.BoundedSemaphore(HASH_SLOTS)
+
+def run_bounded(function, *args):
+    if not slots.acquire(timeout=HASH_WAIT):
+        raise APIException("Too many logins in progress, retry later", status_code=503,
+                           headers={"Retry-After": "1"})
+    try:
+        return function(*args)
+    finally:
+        slots.release()
+
+def make_hash(password, method=None):
+    return generate_password_hash(password, method=method or HASH_METHOD)
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES)
+
+def needs_rehash(stored, method=None):
+    if not is_hashed(stored):
+        return True
+    method = method or HASH_METHOD
+    stored_method = stored.split("$", 1)[0]
+    # werkzeug stores the defaults too: "scrypt" is saved as "scrypt:32768:8:1"
+    return stored_method != method and not stored_method.startswith(method + ":")
+
+def check_hash(stored, password, method=None):
+    # returns (ok, new_hash), new_hash is set when the stored value must be upgraded
+    if is_hashed(stored):
+        ok = check_password_hash(stored, password)
+    else:
+        # legacy plaintext row
+        ok = hmac.compare_digest(stored.encode(), password.encode())
+    if ok and needs_rehash(stored, method):
+        return True, make_hash(password, method)
+    return ok, None
+
+def hash_password(password):
+    return run_bounded(make_hash, password)
+
+def verify_password(stored, password):
+    return run_bounded(check_hash, stored, password)
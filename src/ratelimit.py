@@ -0,0 +1,168 @@
+"""
+Token bucket rate limiting for the unauthenticated endpoints (/login, /signup).
+
+Buckets are keyed by client IP and by the email in the body, and checked
+before the view runs, so a rejected request never reaches User.query. A
+rejection is a 429 with Retry-After.
+
+RATE_LIMITS="login=10/60,signup=5/300" sets capacity/seconds per route.
+RATE_LIMIT_BACKEND picks where buckets live:
+    memory  per gunicorn worker (default)
+    file    a SQLite file (RATE_LIMIT_FILE) shared by the workers of one host
+    redis   RATE_LIMIT_REDIS_URL, shared by every instance
+"""
+import os
+import math
+import time
+import random
+import sqlite3
+import threading
+from functools import wraps
+from flask import request, current_app
+from utils import APIException
+from cache import redis_client_from_env
+
+DEFAULT_LIMITS = "login=10/60,signup=5/300"
+# share of FileBuckets.take calls that also delete the buckets that refilled
+PRUNE_FRACTION = 0.01
+
+def parse_limits(value):
+    # "login=10/60" -> {"login": (capacity 10, refill 10/60 tokens per second)}
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, rule = item.split("=")
+        capacity, seconds = rule.split("/")
+        limits[name.strip()] = (float(capacity), float(capacity) / float(seconds))
+    return limits
+
+def refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + (now - updated) * rate)
+
+def result(tokens, rate):
+    # (allowed, seconds until one token is available)
+    if tokens >= 1:
+        return True, 0
+    return False, math.ceil((1 - tokens) / rate)
+
+class MemoryBuckets:
+    def __init__(self):
+        self.buckets = {}  # key -> (tokens, updated, capacity, rate)
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))[:2]
+            tokens = refill(tokens, updated, capacity, rate, now)
+            allowed, retry_after = result(tokens, rate)
+            self.buckets[key] = (tokens - 1 if allowed else tokens, now, capacity, rate)
+            if len(self.buckets) > 100000:
+                # full buckets carry no state, drop them (each with its own route's limits)
+                self.buckets = {key: value for key, value in self.buckets.items()
+                                if refill(value[0], value[1], value[2], value[3], now) < value[2]}
+        return allowed, retry_after
+
+class FileBuckets:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as connection:
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(bucket)")]
+            if columns and "capacity" not in columns:
+                # file from before capacity/rate were stored, buckets are disposable
+                connection.execute("DROP TABLE bucket")
+            connection.execute("CREATE TABLE IF NOT EXISTS bucket "
+                               "(key TEXT PRIMARY KEY, tokens REAL, updated REAL, capacity REAL, rate REAL)")
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return self.local.connection
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        connection = self.connection()
+        # BEGIN IMMEDIATE takes the write lock, so workers update a bucket one at a time
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens = refill(row[0], row[1], capacity, rate, now) if row else capacity
+            allowed, retry_after = result(tokens, rate)
+            connection.execute("INSERT OR REPLACE INTO bucket (key, tokens, updated, capacity, rate) "
+                               "VALUES (?, ?, ?, ?, ?)", (key, tokens - 1 if allowed else tokens, now, capacity, rate))
+            if random.random() < PRUNE_FRACTION:
+                # full buckets carry no state, without this the file keeps every IP and email ever seen
+                connection.execute("DELETE FROM bucket WHERE tokens + (? - updated) * rate >= capacity", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+# KEYS[1] bucket, ARGV capacity, rate, now -> {allowed, retry_after}
+REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = capacity
+if bucket[1] then
+    tokens = math.min(capacity, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+if allowed == 1 then
+    return {1, 0}
+end
+return {0, math.ceil((1 - tokens) / rate)}
+"""
+
+class RedisBuckets:
+    def __init__(self, client, prefix="swapi:ratelimit:"):
+        self.prefix = prefix
+        self.script = client.register_script(REDIS_TAKE)
+
+    def take(self, key, capacity, rate):
+        allowed, retry_after = self.script(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        return bool(allowed), int(retry_after)
+
+def setup_rate_limits(app):
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        buckets = MemoryBuckets()
+    elif backend == "file":
+        buckets = FileBuckets(os.getenv("RATE_LIMIT_FILE", "/tmp/swapi-ratelimit.db"))
+    elif backend == "redis":
+        buckets = RedisBuckets(redis_client_from_env("RATE_LIMIT_REDIS_URL"))
+    elif backend == "none":
+        buckets = None
+    else:
+        raise ValueError("Unknown RATE_LIMIT_BACKEND " + backend)
+    app.extensions["rate_limits"] = (buckets, parse_limits(os.getenv("RATE_LIMITS", DEFAULT_LIMITS)))
+    return buckets
+
+def rate_limited(name):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            buckets, limits = current_app.extensions["rate_limits"]
+            if buckets is None or name not in limits:
+                return view(*args, **kwargs)
+            capacity, rate = limits[name]
+            keys = [name + ":ip:" + str(request.remote_addr)]
+            body = request.get_json(force=True, silent=True)
+            if isinstance(body, dict) and isinstance(body.get("email"), str):
+                keys.append(name + ":email:" + body["email"].strip().lower())
+            for key in keys:
+                allowed, retry_after = buckets.take(key, capacity, rate)
+                if not allowed:
+                    raise APIException("Too many requests, retry later", status_code=429,
+                                       headers={"Retry-After": str(retry_after)})
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,80 @@
+"""
+Read replica routing. Set DATABASE_REPLICA_URL and GET/HEAD requests run
+their SELECTs on the "replica" bind, everything else stays on the primary.
+
+Read-your-writes: after a successful write, the same caller (Authorization
+header or client IP) reads from the primary for REPLICA_STICKY_SECONDS. That is
+tracked in this worker and in a cookie, so cookie keeping clients stay on the
+primary whichever worker serves them. Other callers, and the catalog cache
+filled by them, can see replica lag during that window.
+"""
+import os
+import time
+import threading
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+
+STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+STICKY_COOKIE = "db_primary_until"
+READ_METHODS = ("GET", "HEAD")
+
+recent_writes = {}  # caller key -> primary until (unix time)
+recent_writes_lock = threading.Lock()
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, "is_select", False) \
+                and has_request_context() and g.get("db_route") == "replica":
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_binds(replica_url, engine_options):
+    if not replica_url:
+        return {}
+    replica_url = replica_url.replace("postgres://", "postgresql://")
+    return {"replica": dict(engine_options(replica_url), url=replica_url)}
+
+def caller_keys():
+    keys = [request.remote_addr]
+    if request.headers.get("Authorization"):
+        keys.append(request.headers["Authorization"])
+    return keys
+
+def recently_wrote():
+    now = time.time()
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    return any(recent_writes.get(key, 0) > now for key in caller_keys())
+
+def remember_write(response):
+    until = time.time() + STICKY_SECONDS
+    with recent_writes_lock:
+        for key in caller_keys():
+            recent_writes[key] = until
+        if len(recent_writes) > 10000:
+            now = time.time()
+            for key in [key for key, value in recent_writes.items() if value <= now]:
+                del recent_writes[key]
+    response.set_cookie(STICKY_COOKIE, "%.3f" % until, max_age=int(STICKY_SECONDS) + 1, httponly=True)
+
+def setup_replica(app):
+    if "replica" not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return False
+
+    @app.before_request
+    def choose_database():
+        if request.method in READ_METHODS and not recently_wrote():
+            g.db_route = "replica"
+        else:
+            g.db_route = "primary"
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in READ_METHODS and request.method != "OPTIONS" and response.status_code < 400:
+            remember_write(response)
+        return response
+
+    return True
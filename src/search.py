@@ -0,0 +1,110 @@
+"""
+Name search over characters and planets for /search?q= (typeahead).
+
+Both backends match names starting with q or having a word that starts with q.
+On Postgres that is ILIKE backed by pg_trgm GIN indexes.
+Other databases (the sqlite:////tmp/test.db fallback) use an in-process sorted
+array of lowercased name words searched with bisect. It is rebuilt when the
+catalog tables change (cache versions), and at least every SEARCH_INDEX_TTL
+seconds since the lru versions only see this worker's writes. Only the first
+build blocks a request, later ones run in a background thread while the old
+index is served.
+"""
+import os
+import time
+import bisect
+import threading
+from flask import current_app
+from models import db, Character, Planet
+
+SEARCHABLE = (("character", Character), ("planet", Planet))
+INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", 60))
+
+class NameIndex:
+    def __init__(self, names):
+        # names: (kind, id, name). Every word of a name is a key so "sky" finds "Luke Skywalker"
+        entries = []
+        for kind, id, name in names:
+            lowered = name.lower()
+            entries.append((lowered, kind, id, name))
+            for position, char in enumerate(lowered):
+                if char == " " and position + 1 < len(lowered):
+                    entries.append((lowered[position + 1:], kind, id, name))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+
+    def search(self, query, limit):
+        query = query.lower()
+        results = []
+        seen = set()
+        position = bisect.bisect_left(self.keys, query)
+        while position < len(self.keys) and self.keys[position].startswith(query) and len(results) < limit:
+            key, kind, id, name = self.entries[position]
+            if (kind, id) not in seen:
+                seen.add((kind, id))
+                results.append({"type": kind, "id": id, "name": name})
+            position += 1
+        return results
+
+def catalog_versions():
+    cache = current_app.extensions.get("response_cache")
+    if cache is None:
+        return None
+    return tuple(cache.version(kind) for kind, model in SEARCHABLE)
+
+def build_index(state, versions):
+    names = []
+    for kind, model in SEARCHABLE:
+        names.extend((kind, id, name) for id, name in db.session.query(model.id, model.name))
+    state.update(index=NameIndex(names), built_at=time.monotonic(), versions=versions)
+
+def rebuild_in_background(app, state, versions):
+    try:
+        with app.app_context():
+            build_index(state, versions)
+    finally:
+        state["rebuilding"] = False
+
+def is_stale(state, versions):
+    return state["versions"] != versions or time.monotonic() - state["built_at"] >= INDEX_TTL
+
+def name_index():
+    # one index per app, built on the first search
+    state = current_app.extensions.setdefault("search_index", {
+        "index": None, "built_at": 0.0, "versions": None, "rebuilding": False, "lock": threading.Lock()})
+    versions = catalog_versions()
+    if state["index"] is None:
+        with state["lock"]:
+            # another thread may have built it while we waited for the lock
+            if state["index"] is None:
+                build_index(state, versions)
+    elif is_stale(state, versions):
+        with state["lock"]:
+            start = not state["rebuilding"]
+            state["rebuilding"] = True
+        if start:
+            threading.Thread(target=rebuild_in_background, daemon=True,
+                             args=(current_app._get_current_object(), state, versions)).start()
+    return state["index"]
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_postgres(query, limit):
+    results = []
+    prefix = escape_like(query) + "%"
+    for kind, model in SEARCHABLE:
+        matches = db.or_(model.name.ilike(prefix, escape="\\"), model.name.ilike("% " + prefix, escape="\\"))
+        rows = db.session.query(model.id, model.name).filter(matches) \
+            .order_by(model.name.ilike(prefix, escape="\\").desc(), db.func.length(model.name), model.name) \
+            .limit(limit)
+        results.extend({"type": kind, "id": id, "name": name} for id, name in rows)
+    # names starting with the query first, then the shorter ones
+    results.sort(key=lambda result: (not result["name"].lower().startswith(query.lower()), len(result["name"])))
+    return results[:limit]
+
+def search_names(query, limit):
+    if db.engine.dialect.name == "postgresql":
+        return search_postgres(query, limit)
+    return name_index().search(query, limit)
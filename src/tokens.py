@@ -0,0 +1,104 @@
+"""
+Revoked JWTs (logout) kept until they would have expired anyway.
+
+The default blocklist is an in-process dict, so the check on every
+@jwt_required() request is a dict lookup and never touches the database.
+It is per gunicorn worker: with more than one worker set TOKEN_BLOCKLIST=redis
+so a logout is seen by all of them.
+
+The caller's User row is resolved through a user_lookup_loader backed by a
+short-TTL per-worker LRU, so protected endpoints do not re-fetch the caller on
+every request. Token identities are user ids, a cache miss is a primary key hit.
+"""
+import os
+import time
+import threading
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+from cache import LRUCache, redis_client_from_env
+
+class MemoryBlocklist:
+    def __init__(self, prune_interval=60):
+        self.tokens = {}  # jti -> exp (unix time)
+        self.lock = threading.Lock()
+        self.prune_interval = prune_interval
+        self.next_prune = time.time() + prune_interval
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.tokens[jti] = expires_at
+        self.prune()
+
+    def __contains__(self, jti):
+        self.prune()
+        return jti in self.tokens
+
+    def prune(self):
+        now = time.time()
+        if now < self.next_prune:
+            return
+        with self.lock:
+            self.next_prune = now + self.prune_interval
+            expired = [jti for jti, expires_at in self.tokens.items() if expires_at <= now]
+            for jti in expired:
+                del self.tokens[jti]
+
+class RedisBlocklist:
+    # entries expire on their own in redis, no pruning needed
+    def __init__(self, client, prefix="swapi:revoked:"):
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, jti, expires_at):
+        ttl = max(int(expires_at - time.time()), 1)
+        self.client.set(self.prefix + jti, 1, ex=ttl)
+
+    def __contains__(self, jti):
+        return bool(self.client.exists(self.prefix + jti))
+
+def setup_tokens(app, jwt):
+    backend = os.getenv("TOKEN_BLOCKLIST", "memory")
+    if backend == "memory":
+        blocklist = MemoryBlocklist()
+    elif backend == "redis":
+        blocklist = RedisBlocklist(redis_client_from_env("TOKEN_BLOCKLIST_REDIS_URL"))
+    else:
+        raise ValueError("Unknown TOKEN_BLOCKLIST " + backend)
+    app.extensions["token_blocklist"] = blocklist
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return jwt_payload["jti"] in blocklist
+
+    user_cache = LRUCache(max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", 1024)),
+                          ttl=int(os.getenv("USER_CACHE_TTL", 30)))
+    app.extensions["user_cache"] = user_cache
+
+    @jwt.user_lookup_loader
+    def load_current_user(jwt_header, jwt_payload):
+        identity = jwt_payload["sub"]
+        if not identity.isdigit():
+            # tokens issued before identities were user ids carry the email
+            return User.query.filter_by(email=identity).first()
+
+        columns = user_cache.get(identity)
+        if columns is None:
+            user = db.session.get(User, int(identity))
+            if user is None:
+                return None
+            user_cache.set(identity, {column.name: getattr(user, column.name) for column in User.__table__.columns})
+            return user
+
+        # rebuild the row from the cached columns and attach it to this
+        # request's session without a SELECT
+        user = User(**columns)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    return blocklist
+
+def forget_user(app, user_id):
+    app.extensions["user_cache"].delete(str(user_id))
+
+def revoke_token(app, jwt_payload):
+    app.extensions["token_blocklist"].add(jwt_payload["jti"], jwt_payload["exp"])
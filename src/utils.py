@@ -1,27 +1,264 @@
-from flask import jsonify, url_for
+import json
+import base64
+import binascii
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context
+from sqlalchemy import tuple_
+
+# keyset pagination defaults for the list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# rows fetched per round trip when streaming a whole table
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = "application/x-ndjson"
+# max rows accepted by the bulk endpoints in one request
+MAX_BULK_ROWS = 10000
 
 class APIException(Exception):
     status_code = 400
 
-    def __init__(self, message, status_code=None, payload=None):
+    def __init__(self, message, status_code=None, payload=None, headers=None):
         Exception.__init__(self)
         self.message = message
         if status_code is not None:
             self.status_code = status_code
         self.payload = payload
+        self.headers = headers
 
     def to_dict(self):
         rv = dict(self.payload or ())
         rv['message'] = self.message
         return rv
 
+def integrity_violation(error):
+    # "unique", "foreign_key" or None for an IntegrityError: the SQLSTATE on
+    # Postgres (psycopg2 pgcode / psycopg sqlstate), the message on SQLite
+    code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    message = str(error.orig)
+    if code == "23505" or "UNIQUE constraint failed" in message:
+        return "unique"
+    if code == "23503" or "FOREIGN KEY constraint failed" in message:
+        return "foreign_key"
+    return None
+
+def int_arg(name, default=None, minimum=None, maximum=None):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException(name + " must be an integer", status_code=400)
+    if minimum is not None and value < minimum:
+        raise APIException(name + " must be >= " + str(minimum), status_code=400)
+    if maximum is not None and value > maximum:
+        value = maximum
+    return value
+
+def ids_arg(name="ids"):
+    # ?ids=1,2,3 for the batch endpoints
+    values = [value for value in request.args.get(name, "").split(",") if value.strip()]
+    if not values:
+        raise APIException(name + " is required", status_code=400)
+    if len(values) > MAX_BULK_ROWS:
+        raise APIException("too many ids, max is " + str(MAX_BULK_ROWS), status_code=413)
+    try:
+        return sorted({int(value) for value in values})
+    except ValueError:
+        raise APIException(name + " must be comma separated integers", status_code=400)
+
+def paginate(query, model, sort=None):
+    # Keyset pagination on the primary key: ?after_id=<last id seen>&limit=<n>
+    # Each page is an index range scan, so walking a big table costs the
+    # same per page no matter how deep the client is (no OFFSET).
+    # With a sort (see requested_sort) the cursor is the opaque ?after= token
+    # holding the last (value, id), and the rows must include the sort column.
+    limit = int_arg("limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    if sort is not None:
+        return paginate_sorted(query, model, sort, limit)
+
+    after_id = int_arg("after_id", minimum=0)
+    if after_id is not None:
+        query = query.filter(model.id > after_id)
+    # fetch one extra row to know if there is a next page without a COUNT(*)
+    items = query.order_by(model.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].id
+    return items, next_cursor
+
+def encode_cursor(value, id):
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+def decode_cursor(cursor, column):
+    # the value must have the sort column's type, anything else would reach the database
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise APIException("invalid after cursor", status_code=400)
+    python_type = column.type.python_type
+    if not isinstance(id, int) or isinstance(id, bool) or (value is not None and (
+            not isinstance(value, python_type) or isinstance(value, bool))):
+        raise APIException("invalid after cursor", status_code=400)
+    return value, id
+
+def paginate_sorted(query, model, sort, limit):
+    # Two phases, each a range scan of the (column, id) index: the rows with a
+    # value in (column, id) order with a row-value seek, then the NULLs (always
+    # last) in id order. A cursor holding a NULL value resumes in the second phase.
+    field, descending = sort
+    column = getattr(model, field)
+    id_order = model.id.desc() if descending else model.id.asc()
+
+    value, last_id = None, None
+    cursor = request.args.get("after")
+    if cursor:
+        value, last_id = decode_cursor(cursor, column)
+
+    items = []
+    if not cursor or value is not None:
+        valued = query.filter(column.isnot(None)).order_by(column.desc() if descending else column.asc(), id_order)
+        if cursor:
+            key, last_key = tuple_(column, model.id), tuple_(value, last_id)
+            valued = valued.filter(key < last_key if descending else key > last_key)
+        items = valued.limit(limit + 1).all()
+    if len(items) <= limit:
+        nulls = query.filter(column.is_(None)).order_by(id_order)
+        if cursor and value is None:
+            nulls = nulls.filter(model.id < last_id if descending else model.id > last_id)
+        items += nulls.limit(limit + 1 - len(items)).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(getattr(items[-1], field), items[-1].id)
+    return items, next_cursor
+
+def list_args(model):
+    # every query string argument a list endpoint reads, ?stream= aside
+    args = ["fields", "sort", "limit", "after_id", "after"]
+    args.extend(model.filter_fields)
+    for field in model.range_fields:
+        args.extend(("min_" + field, "max_" + field))
+    return tuple(args)
+
+def apply_filters(query, model):
+    # ?climate=arid (equality on model.filter_fields)
+    # ?min_population=1000&max_population=50000 (ranges on model.range_fields)
+    for field in model.filter_fields:
+        value = request.args.get(field)
+        if value is not None:
+            query = query.filter(getattr(model, field) == value)
+    for field in model.range_fields:
+        minimum = int_arg("min_" + field)
+        if minimum is not None:
+            query = query.filter(getattr(model, field) >= minimum)
+        maximum = int_arg("max_" + field)
+        if maximum is not None:
+            query = query.filter(getattr(model, field) <= maximum)
+    return query
+
+def requested_sort(model):
+    # ?sort=population or ?sort=-population, on model.sort_fields
+    value = request.args.get("sort")
+    if not value or value in ("id", "+id"):
+        return None
+    descending = value.startswith("-")
+    field = value.lstrip("+-")
+    if field not in model.sort_fields:
+        raise APIException("Cannot sort by " + field, status_code=400,
+                           payload={"allowed": list(model.sort_fields)})
+    return field, descending
+
+def requested_fields(model):
+    # ?fields=id,name limits the columns selected and serialized
+    value = request.args.get("fields")
+    if value is None:
+        return None
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    if not fields:
+        raise APIException("fields cannot be empty", status_code=400)
+    unknown = [field for field in fields if field not in model.serialize_fields]
+    if unknown:
+        raise APIException("Unknown fields: " + ", ".join(unknown), status_code=400,
+                           payload={"allowed": list(model.serialize_fields)})
+    return fields
+
+def wants_ndjson():
+    # ?stream=1 or Accept: application/x-ndjson switches a list endpoint to streaming
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+def stream_ndjson(query, model, fields=None):
+    # Stream the whole table one JSON object per line. yield_per makes the
+    # driver use a server-side cursor, so only one batch of rows is in memory
+    # at a time instead of the full list + the full jsonify string.
+    after_id = int_arg("after_id", minimum=0)
+    if after_id is not None:
+        query = query.filter(model.id > after_id)
+    # query selects plain columns (Model.serialize_columns()), rows are encoded as they come
+    session = query.session
+    statement = query.order_by(model.id).statement
+
+    def generate():
+        dumps = current_app.json.dumps
+        rows = session.execute(statement, execution_options={"yield_per": STREAM_BATCH_SIZE})
+        keys = tuple(rows.keys())
+        if fields is None:
+            for row in rows:
+                yield dumps(dict(zip(keys, row))) + "\n"
+        else:
+            positions = [keys.index(field) for field in fields]
+            for row in rows:
+                yield dumps({field: row[position] for field, position in zip(fields, positions)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+def parse_bulk_body():
+    # bulk endpoints take a JSON array, or NDJSON (one object per line)
+    if request.mimetype == NDJSON_MIMETYPE:
+        rows = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(current_app.json.loads(line))
+            except ValueError:
+                raise APIException("invalid JSON on line " + str(number), status_code=400)
+    else:
+        rows = request.get_json(force=True, silent=True)
+        if not isinstance(rows, list):
+            raise APIException("body must be a JSON array or NDJSON", status_code=400)
+    if len(rows) == 0:
+        raise APIException("body has no rows", status_code=400)
+    if len(rows) > MAX_BULK_ROWS:
+        raise APIException("too many rows, max is " + str(MAX_BULK_ROWS), status_code=413)
+    return rows
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
+def route_index(app):
+    # every route and its methods, the JSON counterpart of the sitemap
+    routes = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == "static" or rule.rule.startswith("/admin/"):
+            continue
+        routes.append({
+            "path": rule.rule,
+            "methods": sorted(rule.methods - {"HEAD", "OPTIONS"}),
+            "endpoint": rule.endpoint
+        })
+    routes.sort(key=lambda route: route["path"])
+    return routes
+
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if "admin" in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters